@@ -0,0 +1,341 @@
+"""
+bench.py: timing benchmarks for the examples.
+
+Usage:
+
+  % python3 bench.py tokenizer          -- time get_words on raven.txt x 10000
+  % python3 bench.py tokenizer 100      -- same, raven.txt x 100
+  % python3 bench.py sm                 -- time sm.interpret against sm.execute
+  % python3 bench.py startup            -- time the start of sm.py, in ms
+  % python3 bench.py simplify 4 8       -- simplified fractal star, 4 rays, depth 8
+  % python3 bench.py suite              -- all modules, with regression tracking
+  % python3 bench.py baseline           -- make the last suite run the baseline
+
+Each benchmark is run a few times and the best time is reported.
+"""
+import sys, os, time, string, math, json
+
+def best_time(f, *args, repeat=3):
+  """Return the best of repeat timings of f(*args), in seconds,
+  and the value returned by f."""
+  best = None
+  for k in range(0, repeat):
+    start = time.perf_counter()
+    value = f(*args)
+    t = time.perf_counter() - start
+    if best is None or t < best:
+      best = t
+  return best, value
+
+def old_get_words(text):
+  """get_words as it was before histo.Cleaner: lower-case, strip
+  punctuation, strip digits, split -- four passes over the text."""
+  text = text.lower()
+  T = text.maketrans('', '', string.punctuation)
+  text = text.translate(T)
+  T = text.maketrans('', '', string.digits)
+  text = text.translate(T)
+  return text.split()
+
+def stream_words(text):
+  """Return the number of words in text, tokenized chunk by chunk."""
+  import histo
+  size = histo.CHUNK_SIZE
+  chunks = (text[k:k+size] for k in range(0, len(text), size))
+  return sum(len(words) for words in histo.chunk_words(chunks))
+
+def bench_tokenizer(copies=10000):
+  """Compare old_get_words with histo.get_words and with the
+  chunked tokenizer on raven.txt repeated copies times."""
+  import histo
+  text = histo.file2string('raven.txt') * copies
+  print("tokenizer: raven.txt x %d, %.1f MB" % (copies, len(text)/1e6))
+  t_old, old_words = best_time(old_get_words, text)
+  t_new, new_words = best_time(histo.get_words, text)
+  t_stream, n = best_time(stream_words, text)
+  if old_words != new_words or n != len(old_words):
+    print("  MISMATCH: tokenizers disagree")
+  words = len(old_words)
+  print("  %-20s %8.3f s  %6.1f Mwords/s" % ("old get_words", t_old, words/t_old/1e6))
+  print("  %-20s %8.3f s  %6.1f Mwords/s" % ("get_words", t_new, words/t_new/1e6))
+  print("  %-20s %8.3f s  %6.1f Mwords/s" % ("chunk_words", t_stream, words/t_stream/1e6))
+  print("  speedup: %.2fx" % (t_old/t_new))
+
+def run_program(f, program, times):
+  """Run program times times with f, return the last value."""
+  for k in range(0, times):
+    value = f(program)
+  return value
+
+def bench_sm(copies=200, times=100):
+  """Compare sm.interpret with sm.execute on an arithmetic program
+  of copies x 10 tokens, each run times times.  Each copy starts from
+  x rcl, so its arithmetic can't be folded into a constant."""
+  import sm
+  sm.verbose_off()
+  code = ("0 1 x sto " + " ".join(["x rcl 2 add 3 mul 4 sub dup mul add"] * copies)).split()
+  print("sm: %d tokens x %d runs" % (len(code), times))
+  t_interp, a = best_time(run_program, sm.interpret, code, times)
+  t_compile, program = best_time(sm.compile_code, code)
+  t_exec, b = best_time(run_program, sm.execute, program, times)
+  if a != b:
+    print("  MISMATCH: interpret and execute disagree")
+  print("  %-20s %8.3f s" % ("interpret", t_interp))
+  print("  %-20s %8.3f s" % ("compile_code", t_compile))
+  print("  %-20s %8.3f s" % ("execute", t_exec))
+  print("  speedup: %.1fx" % (t_interp/t_exec))
+
+def start_time(command, runs, cold):
+  """Return the best of runs wall-clock times of command, in ms.  Cold:
+  each run with an empty bytecode cache; warm: with the cache filled
+  by a first run."""
+  import subprocess, tempfile
+  env = dict(os.environ)
+  best = None
+  with tempfile.TemporaryDirectory() as cache:
+    env['PYTHONPYCACHEPREFIX'] = cache
+    if not cold:
+      subprocess.run(command, stdout=subprocess.DEVNULL, env=env)
+    for k in range(0, runs):
+      if cold:
+        env['PYTHONPYCACHEPREFIX'] = os.path.join(cache, str(k))
+      start = time.perf_counter()
+      subprocess.run(command, stdout=subprocess.DEVNULL, env=env)
+      t = time.perf_counter() - start
+      if best is None or t < best:
+        best = t
+  return best * 1000
+
+def bench_startup(runs=20):
+  """Time the start of 'python3 sm.py -s 1 2 add', cold and warm,
+  against that of python itself."""
+  commands = [("python", [sys.executable, "-c", "pass"]),
+              ("sm.py -s 1 2 add", [sys.executable, "sm.py", "-s", "1", "2", "add"]),
+              ("import sm", [sys.executable, "-c", "import sm"])]
+  print("startup: best of %d runs" % runs)
+  print("  %-20s %8s %8s" % ("", "cold ms", "warm ms"))
+  for name, command in commands:
+    cold = start_time(command, runs, True)
+    warm = start_time(command, runs, False)
+    print("  %-20s %8.1f %8.1f" % (name, cold, warm))
+
+def save_star(segments, format):
+  """Draw segments with a RecordingTurtle, save them as star.format in a
+  temporary directory; return the size of the file in bytes."""
+  import tempfile
+  from recorder import RecordingTurtle
+  turtle = RecordingTurtle()
+  turtle.draw_segments(segments)
+  with tempfile.TemporaryDirectory() as directory:
+    name = os.path.join(directory, "star." + format)
+    turtle.save(name)
+    return os.path.getsize(name)
+
+def bench_simplify(rays=4, depth=8):
+  """Compare the segments of a fractal star (as star.py draws it) with
+  those simplified by geometry.simplify: number, EPS size, and time to
+  write EPS and PNG."""
+  from geometry import star_segments, simplify
+  segments = star_segments(rays, 200, depth, 0.3)
+  t_simplify, simple = best_time(simplify, segments, repeat=1)
+  print("simplify: star of %d rays, depth %d" % (rays, depth))
+  print("  %-20s %10s %10s %10s %10s" % ("", "segments", "EPS bytes", "EPS s", "PNG s"))
+  for name, s in (("as drawn", segments), ("simplified", simple)):
+    t_eps, size = best_time(save_star, s, "eps", repeat=1)
+    t_png, _ = best_time(save_star, s, "png", repeat=1)
+    print("  %-20s %10d %10d %10.3f %10.3f" % (name, len(s), size, t_eps, t_png))
+  print("  %-20s %10.3f s" % ("simplify", t_simplify))
+
+##########################################################
+# SUITE
+##########################################################
+
+"""
+'python3 bench.py suite' runs every benchmark case below, on inputs made
+up for the purpose, at sizes set by the scale (1: seconds, 2: a minute,
+3: larger still -- raven.txt x 10000, star depth 9, 10^8 walk steps):
+
+  histo       get_words and histogram on raven.txt repeated
+  sm          run and interpret on long arithmetic programs, and run
+              on definitions nested deep (each defprog calls the one before)
+  star        the segments of star.py's star, drawn with a RecordingTurtle
+  walks       end_distances on walks of 1000 steps
+
+Each case is run at least repeat times (more if it is quick), and gives
+its throughput (items per second at the median time), latency (median,
+90th and 99th percentile, in ms) and peak memory (tracemalloc, in MB).
+The results are appended to BENCH_HISTORY, and compared with those in
+BENCH_BASELINE (saved by 'python3 bench.py baseline' from the last run):
+a case whose throughput drops, or whose median latency or peak memory
+rises, by more than the threshold (REGRESSION percent) is flagged, and
+the suite exits with status 1.
+
+  % python3 bench.py suite              -- scale 1, repeat 5
+  % python3 bench.py suite 2 10 5       -- scale 2, repeat 10, flag at 5%
+  % python3 bench.py baseline           -- the last run becomes the baseline
+"""
+
+BENCH_HISTORY = 'bench-history.json'
+BENCH_BASELINE = 'bench-baseline.json'
+REGRESSION = 10
+
+def histo_cases(scale):
+  import histo
+  text = histo.file2string('raven.txt')
+  for copies in [10, 100, 1000, 10000][:scale + 1]:
+    words = len(histo.get_words(text)) * copies
+    yield ("histo.get_words raven x %d" % copies, lambda c=copies: text * c,
+           histo.get_words, words, "words")
+    yield ("histo.histogram raven x %d" % copies, lambda c=copies: histo.get_words(text * c),
+           histo.histogram, words, "words")
+
+def nested_machine(depth):
+  """A StackMachine where p0 adds pi and each of p1 .. p(depth-1) calls
+  the one before it and adds pi, and x is 1."""
+  import sm
+  machine = sm.StackMachine()
+  machine.run("1 x sto")
+  machine.run("defprog p0 pi add /defprog")
+  for k in range(1, depth):
+    machine.run("defprog p%d p%d pi add /defprog" % (k, k - 1))
+  return machine
+
+def sm_cases(scale):
+  import sm
+  sm.verbose_off()
+  for copies in [10, 100, 1000][:scale + 1]:
+    # x rcl keeps the arithmetic from being folded into a constant
+    code = "1 x sto " + " ".join(["x rcl 2 add 3 mul 4 sub dup mul pop"] * copies)
+    tokens = len(code.split())
+    yield ("sm.run %d tokens" % tokens, lambda c=code: c, sm.run, tokens, "tokens")
+    yield ("sm.interpret %d tokens" % tokens, lambda c=code: c.split(), sm.interpret, tokens, "tokens")
+  # x rcl, not a number, so the nested calls can't be folded into one
+  for depth in [10, 100, 300][:scale + 1]:
+    yield ("sm.run nested defprog depth %d" % depth, lambda d=depth: nested_machine(d),
+           lambda m, d=depth: m.run("x rcl p%d" % (d - 1)), depth, "calls")
+
+def draw_star(depth):
+  from recorder import RecordingTurtle
+  import sweep
+  turtle = RecordingTurtle()
+  sweep.draw_star(turtle, 4, depth)
+  return turtle
+
+def star_cases(scale):
+  for depth in range(1, [5, 7, 9][scale - 1] + 1):
+    yield ("star depth %d" % depth, lambda d=depth: d, draw_star,
+           sum(4**k for k in range(1, depth + 2)), "segments")
+
+def walk_cases(scale):
+  import walks
+  for total in [10**k for k in range(3, [6, 8, 9][scale - 1])]:
+    yield ("walks %d steps" % total, lambda t=total: t // 1000,
+           lambda n: walks.end_distances(n, 1000, seed=1), total, "steps")
+
+def suite_cases(scale):
+  """Yield (name, setup, run, items, unit): run(setup()) is timed, and
+  does items units of work."""
+  for cases in (histo_cases, sm_cases, star_cases, walk_cases):
+    for case in cases(scale):
+      yield case
+
+def percentile(times, q):
+  """The q-th percentile (nearest rank) of sorted times."""
+  return times[min(len(times) - 1, max(0, math.ceil(q / 100 * len(times)) - 1))]
+
+def measure(setup, run, items, repeat, budget=0.5):
+  """Time run(setup()) at least repeat times, and more while under budget
+  seconds; return its results for the history."""
+  import tracemalloc
+  arg = setup()
+  times = [ ]
+  while len(times) < repeat or (sum(times) < budget and len(times) < 1000):
+    start = time.perf_counter()
+    run(arg)
+    times.append(time.perf_counter() - start)
+  times.sort()
+  tracemalloc.start()
+  run(arg)
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return {'throughput': items / percentile(times, 50), 'runs': len(times),
+          'p50_ms': 1000 * percentile(times, 50), 'p90_ms': 1000 * percentile(times, 90),
+          'p99_ms': 1000 * percentile(times, 99), 'peak_mb': peak / 1e6}
+
+def read_json(name, default):
+  try:
+    with open(name) as file:
+      return json.load(file)
+  except (OSError, ValueError):
+    return default
+
+def write_json(name, value):
+  temp = "%s.%d" % (name, os.getpid())
+  with open(temp, 'w') as file:
+    json.dump(value, file, indent=1)
+  os.replace(temp, name)
+
+def regressions(result, base, threshold):
+  """The changes of result from base worse than threshold percent."""
+  limit = threshold / 100
+  found = [ ]
+  if result['throughput'] < base['throughput'] * (1 - limit):
+    found.append("throughput %+.0f%%" % (100 * (result['throughput'] / base['throughput'] - 1)))
+  if result['p50_ms'] > base['p50_ms'] * (1 + limit):
+    found.append("latency %+.0f%%" % (100 * (result['p50_ms'] / base['p50_ms'] - 1)))
+  if result['peak_mb'] > base['peak_mb'] * (1 + limit) + 0.1:
+    found.append("memory %+.0f%%" % (100 * (result['peak_mb'] / base['peak_mb'] - 1)))
+  return found
+
+def bench_suite(scale=1, repeat=5, threshold=REGRESSION):
+  """Run the suite, record it in BENCH_HISTORY and compare it with
+  BENCH_BASELINE; see above."""
+  import platform, datetime
+  baseline = read_json(BENCH_BASELINE, None)
+  base = baseline['results'] if baseline else { }
+  run = {'time': datetime.datetime.now().isoformat(timespec='seconds'),
+         'python': platform.python_version(), 'machine': platform.machine(),
+         'scale': scale, 'results': { }}
+  print("suite: scale %d, repeat %d%s" % (scale, repeat,
+        ", baseline of %s" % baseline['time'] if baseline else ", no baseline"))
+  print("  %-32s %14s %-8s %10s %10s %9s" % ("", "per second", "", "p50 ms", "p99 ms", "peak MB"))
+  flagged = 0
+  for name, setup, f, items, unit in suite_cases(scale):
+    result = measure(setup, f, items, repeat)
+    run['results'][name] = dict(result, unit=unit, items=items)
+    found = regressions(result, base[name], threshold) if name in base else [ ]
+    flagged = flagged + (1 if found else 0)
+    print("  %-32s %14.4g %-8s %10.3f %10.3f %9.2f  %s" %
+          (name, result['throughput'], unit, result['p50_ms'], result['p99_ms'], result['peak_mb'],
+           "REGRESSION: " + ", ".join(found) if found else ""))
+  history = read_json(BENCH_HISTORY, [ ])
+  history.append(run)
+  write_json(BENCH_HISTORY, history)
+  print("  %d cases, %d regressions; recorded in %s" % (len(run['results']), flagged, BENCH_HISTORY))
+  if flagged:
+    sys.exit(1)
+
+def bench_baseline():
+  """Save the last run of the suite as the baseline."""
+  history = read_json(BENCH_HISTORY, [ ])
+  if not history:
+    print("no runs in %s" % BENCH_HISTORY)
+    return
+  write_json(BENCH_BASELINE, history[-1])
+  print("baseline: the run of %s, %d cases, in %s" %
+        (history[-1]['time'], len(history[-1]['results']), BENCH_BASELINE))
+
+benchmarks = { }
+benchmarks['tokenizer'] = bench_tokenizer
+benchmarks['sm'] = bench_sm
+benchmarks['startup'] = bench_startup
+benchmarks['simplify'] = bench_simplify
+benchmarks['suite'] = bench_suite
+benchmarks['baseline'] = bench_baseline
+
+if __name__ == "__main__":
+  if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+    print(__doc__)
+  else:
+    args = [int(a) for a in sys.argv[2:]]
+    benchmarks[sys.argv[1]](*args)
@@ -15,8 +15,7 @@
 # REQUIRES: utilities.py, this site
 
 import sys 
-from utilities import saveImage
-from turtle import *
+from utilities import saveImage, new_turtle, draw_segments
 
 
 def star(turtle, n,r):
@@ -45,15 +44,28 @@ def recursive_star(turtle, n, r, depth):
       turtle.penup()
       turtle.backward(r)
       turtle.left(360/n)
+
+def draw_recursive_star(turtle, n, r, depth):
+  """Draw what recursive_star draws, from segments computed all at once
+  by geometry.star_segments and simplified (merged and chained) by 
+  geometry.simplify; without NumPy, by recursive_star itself."""
+  try:
+    from geometry import star_segments, simplify
+    segments = simplify(star_segments(n, r, depth, f))
+  except ImportError:
+    recursive_star(turtle, n, r, depth)
+    return
+  draw_segments(turtle, segments)
+  turtle.penup()
  
  
-fred = Turtle()
+fred = new_turtle()
 fred.speed("fastest")
 # star(fred, 20, 100) # draw a 20-star
 
 # Draw a fractal cross of depth 4:
-recursive_star(fred, 4, 100, int(sys.argv[1]))
+draw_recursive_star(fred, 4, 100, int(sys.argv[1]))
 fred.hideturtle()
 saveImage(fred, "cross.eps")
-exitonclick()  
+fred.getscreen().exitonclick()  
     
@@ -0,0 +1,169 @@
+# file: geometry.py
+"""
+The segments of the fractal figures, computed directly rather than
+traced with a turtle.
+
+recursive_star(turtle, n, r, depth) in star.py and cross.py draws n
+rays of length r from a point, and at the end of each ray a star of
+depth - 1 with rays f*r; at depth 0 it draws a plain star of n rays
+f*4.  That is n + n**2 + ... + n**(depth+1) segments, each traced with
+a forward, a backward and a left, and the turtle's heading drifts.
+
+star_segments computes them level by level.  The points and headings
+of a level are complex NumPy arrays, the heading a unit number; the
+rays of the next level are
+
+  point + length * heading * w**k,   w = exp(2 pi i / n),  k = 0 .. n-1
+
+so each level costs a few array operations, whatever its size.  The
+result is one contiguous float64 array with a row x0 y0 x1 y1 for each
+segment, to be drawn in one call (RecordingTurtle.draw_segments, or
+utilities.draw_segments for any turtle).  Segments come level by level,
+not in the order the turtle draws them.
+
+  >>> star_segments(4, 200, 1, 0.3).shape
+  (20, 4)
+"""
+
+def star_segments(n, r, depth, f, leaf=4):
+  """Return the segments drawn by recursive_star(turtle, n, r, depth) with
+  rescaling factor f, starting at (0, 0) heading east, as an array of shape
+  (segments, 4).  leaf*f is the length of the rays of the last stars."""
+  import numpy
+  w = numpy.exp(2j * numpy.pi * numpy.arange(0, n) / n)
+  points = numpy.zeros(1, dtype=complex)
+  headings = numpy.ones(1, dtype=complex)
+  levels = [ ]
+  for level in range(0, depth + 1):
+    if level == depth:
+      r = f * leaf
+    headings = numpy.outer(headings, w).ravel()
+    starts = numpy.repeat(points, n)
+    points = starts + r * headings
+    levels.append((starts, points))
+    r = f * r
+  segments = numpy.empty((sum(len(s) for (s, e) in levels), 4))
+  k = 0
+  for starts, ends in levels:
+    m = len(starts)
+    segments[k:k+m, 0] = starts.real
+    segments[k:k+m, 1] = starts.imag
+    segments[k:k+m, 2] = ends.real
+    segments[k:k+m, 3] = ends.imag
+    k = k + m
+  return segments
+
+##########################################################
+# SIMPLIFICATION
+##########################################################
+
+"""
+The segments of a turtle drawing can be far more than the picture needs:
+in a star of an even number of rays, the rays k and k + n/2 lie on one
+line, and each small star draws a ray back along the ray it sits on.
+simplify(segments) draws the same picture with fewer, longer strokes:
+
+  merge_collinear drops segments shorter than tolerance, and merges the
+  segments on one line (to within tolerance) which overlap or touch,
+  so that duplicates go too;
+
+  chain orders and orients the segments so that as many as possible
+  start where the one before ended; writers such as write_eps then
+  draw each chain as one polyline.
+"""
+
+def merge_collinear(segments, tolerance=1e-6):
+  """Return segments (a sequence x0 y0 x1 y1 ..., or an array of rows) with
+  those shorter than tolerance dropped, and those on one line merged where
+  they overlap or touch; see above.  The result is an array of rows."""
+  import numpy
+  s = numpy.asarray(segments, dtype=float).reshape(-1, 4)
+  d = s[:, 2:] - s[:, :2]
+  s = s[numpy.hypot(d[:, 0], d[:, 1]) > tolerance]
+  if len(s) == 0:
+    return s
+  d = s[:, 2:] - s[:, :2]
+  # The direction of the line, 0 <= theta < pi, is found to within
+  # angle, so that points of the drawing are placed to within tolerance.
+  angle = tolerance / max(1.0, numpy.abs(s).max())
+  theta = numpy.arctan2(d[:, 1], d[:, 0]) % numpy.pi
+  angle_key = numpy.round(theta / angle).astype(numpy.int64)
+  wrap = angle_key == int(round(numpy.pi / angle))
+  angle_key[wrap] = 0
+  theta[wrap] = theta[wrap] - numpy.pi
+  ux = numpy.cos(theta)
+  uy = numpy.sin(theta)
+  offset = ux * s[:, 1] - uy * s[:, 0]
+  offset_key = numpy.round(offset / tolerance).astype(numpy.int64)
+  t0 = ux * s[:, 0] + uy * s[:, 1]
+  t1 = ux * s[:, 2] + uy * s[:, 3]
+  lo = numpy.minimum(t0, t1)
+  hi = numpy.maximum(t0, t1)
+  # The ends of each segment, low end first along the line.
+  s = numpy.where((t0 <= t1)[:, None], s, s[:, [2, 3, 0, 1]])
+  order = numpy.lexsort((lo, offset_key, angle_key))
+  angle_key, offset_key = angle_key[order], offset_key[order]
+  lo, hi, s = lo[order], hi[order], s[order]
+  new_line = numpy.ones(len(lo), dtype=bool)
+  new_line[1:] = (angle_key[1:] != angle_key[:-1]) | (offset_key[1:] != offset_key[:-1])
+  # Running maximum of hi within each line: shift each line above the
+  # ones before it, so that one running maximum does for all.
+  span = hi.max() - lo.min() + 1
+  line = numpy.cumsum(new_line) - 1
+  reach = numpy.maximum.accumulate(hi - lo.min() + line * span) - line * span + lo.min()
+  new_run = new_line.copy()
+  new_run[1:] |= lo[1:] > reach[:-1] + tolerance
+  # A merged segment runs from the low end of the first segment of its
+  # run to the high end of the one reaching furthest.
+  run = numpy.cumsum(new_run) - 1
+  furthest = numpy.lexsort((hi, run))
+  last = numpy.ones(len(run), dtype=bool)
+  last[:-1] = run[furthest[1:]] != run[furthest[:-1]]
+  return numpy.column_stack((s[new_run, :2], s[furthest[last], 2:]))
+
+def chain(segments, tolerance=1e-6):
+  """Return segments (rows x0 y0 x1 y1) reordered and reoriented so that
+  they form few chains, each segment starting exactly where the one
+  before it ended if their ends are within tolerance."""
+  import numpy
+  s = numpy.asarray(segments, dtype=float).reshape(-1, 4)
+  m = len(s)
+  if m == 0:
+    return s.copy()
+  ends = numpy.round(s.reshape(-1, 2) / tolerance).astype(numpy.int64)
+  vertices = numpy.unique(ends, axis=0, return_inverse=True)[1].reshape(-1).tolist()
+  at = { }
+  for k in range(0, 2 * m):
+    at.setdefault(vertices[k], [ ]).append(k >> 1)
+  # Start chains at the ends of odd degree first: an Euler path must.
+  starts = [v for v in at if len(at[v]) % 2] + list(at)
+  used = bytearray(m)
+  order = [ ]
+  flip = [ ]
+  for v in starts:
+    edges = at[v]
+    while edges:
+      i = edges.pop()
+      if used[i]:
+        continue
+      used[i] = 1
+      order.append(i)
+      flip.append(vertices[2*i] != v)
+      v = vertices[2*i+1] if vertices[2*i] == v else vertices[2*i]
+      edges = at[v]
+  result = s[order]
+  flip = numpy.array(flip)
+  result[flip] = result[flip][:, [2, 3, 0, 1]]
+  # Snap each start to the end before it, within the same chain.
+  joined = numpy.zeros(m, dtype=bool)
+  joined[1:] = numpy.abs(result[1:, :2] - result[:-1, 2:]).max(axis=1) <= 2 * tolerance
+  result[1:, :2][joined[1:]] = result[:-1, 2:][joined[1:]]
+  return result
+
+def simplify(segments, tolerance=1e-6):
+  """Return the segments, merged by merge_collinear and ordered by chain:
+
+  >>> simplify([0, 0, 1, 0,  1, 0, 2, 0,  2, 0, 0, 0,  0, 0, 0, 1,  3, 3, 3, 3]).tolist()
+  [[2.0, 0.0, 0.0, 0.0], [0.0, 0.0, 0.0, 1.0]]
+  """
+  return chain(merge_collinear(segments, tolerance), tolerance)
@@ -8,10 +8,53 @@ Usage:
 
   % python histo.py raven.txt -j junkwords.txt 
 
+  % python histo.py big.txt --workers 8
+
+  % python histo.py raven.txt -j junkwords.txt -j names.txt
+
+  % python histo.py big.txt --top 20
+
+  % python histo.py huge.txt --top 20 --approx 10000
+
+  % python histo.py server.log --index
+
+  % python histo.py a.log b.log c.log --index -o corpus.histo
+
+  % python histo.py big.txt --format bin
+
 The first produces a histogram of raven.txt.  The second does the same
-after removing the words in junkwords.txt  
+after removing the words in junkwords.txt  The third splits big.txt
+into 8 pieces at word boundaries, counts them in 8 processes and
+merges the results; the output is the same as for a single process.
+The fourth removes the words of both junk files.  The junk words are
+kept in a set, and the set is cached on disk next to the first junk
+file (see stop_cache_path); the cache is rebuilt when any of the junk
+files changes.  The fifth prints only the 20 most frequent words,
+picked with a heap rather than a full sort, and writes no .histo file.
+The sixth does the same in fixed memory: it keeps counts for at most
+10000 words (see SpaceSaving), so the counts are estimates, each at
+most N/10000 too high for a text of N words.
+
+With --index the counts are also saved in server.log.*.histo.idx (see
+index_path), in the directory of the .histo file (so the input's may
+be read-only), with the number of bytes counted and checksums of the
+start of the file and of the bytes just before that point.  If the file has only grown since,
+the next run counts just the new bytes.  The seventh line merges the
+histograms of three such files into corpus.histo.
+
+--format chooses the layout of the histogram file: 'text' (the
+default, as printed on the terminal), 'tsv' (word, count, relative
+frequency separated by tabs) or 'bin' (see write_binary).  The tsv
+and bin files are named *.histo.tsv and *.histo.bin and can be read
+back with read_table.
+
+The file is read in chunks of CHUNK_SIZE characters and the histogram
+is updated chunk by chunk, so memory use depends on the number of
+distinct words, not on the size of the file.
 """
-import sys, string, re
+import sys, string, re, os, locale, codecs, argparse, heapq, json, hashlib, struct
+from collections import Counter
+from multiprocessing import Pool
 
 def string2file(s,filename):
   """
@@ -31,6 +74,123 @@ def file2string(path):
   file.close()
   return text
 
+CHUNK_SIZE = 1 << 20   # characters read per chunk
+
+def file_chunks(path, size=CHUNK_SIZE):
+  """
+  Yield the contents of the file at path in pieces
+  of at most size characters.  Counting them gives the same
+  histogram as counting the whole text, wherever the words
+  are cut:
+
+  >>> import tempfile, shutil
+  >>> directory = tempfile.mkdtemp()
+  >>> path = os.path.join(directory, 'sample.txt')
+  >>> text = "Once upon a midnight dreary, ΣΟΦΟΣ pondered weak and weary.\\n" * 20
+  >>> string2file(text, path)
+  >>> reference = histogram(get_words(text))
+  >>> all(stream_histogram(file_chunks(path, size)) == reference for size in (1, 2, 3, 7, 64))
+  True
+  >>> shutil.rmtree(directory)
+  """
+  with open(path,'r') as file:
+    while True:
+      chunk = file.read(size)
+      if not chunk:
+        break
+      yield chunk
+
+def byte_range_chunks(path, start, end, size=CHUNK_SIZE):
+  """
+  Yield the text in bytes start..end of the file at path, in 
+  pieces of at most size bytes, decoded as open(path,'r') would.
+  """
+  encoding = locale.getpreferredencoding(False)
+  decoder = codecs.getincrementaldecoder(encoding)()
+  with open(path,'rb') as file:
+    file.seek(start)
+    left = end - start
+    while left > 0:
+      data = file.read(min(size, left))
+      if not data:
+        break
+      left = left - len(data)
+      chunk = decoder.decode(data, left <= 0)
+      if chunk:
+        yield chunk
+
+# ASCII whitespace bytes.  In UTF-8 and the ISO-8859 encodings these
+# never occur inside a multi-byte character, so a shard can start
+# at any of them without cutting a word or a character in two.
+SPACE_BYTE = re.compile(rb'[ \t\n\r\x0b\x0c\x1c-\x1f]')
+
+def next_space(file, pos, size):
+  """Return the position of the first whitespace byte at
+  or after pos, or size if there is none."""
+  file.seek(pos)
+  while pos < size:
+    data = file.read(1 << 16)
+    if not data:
+      break
+    m = SPACE_BYTE.search(data)
+    if m:
+      return pos + m.start()
+    pos = pos + len(data)
+  return size
+
+def shard_boundaries(path, n, start=0, end=None):
+  """Split bytes start..end of the file at path (by default the
+  whole file) into at most n byte ranges which begin and end at
+  word boundaries.  start and end must be word boundaries
+  themselves.  Return the list of (start, end) pairs.
+
+  >>> import tempfile, shutil
+  >>> directory = tempfile.mkdtemp()
+  >>> path = os.path.join(directory, 'sample.txt')
+  >>> text = "Quoth the Raven, 'Nevermore.' ΣΟΦΟΣ\\n" * 30
+  >>> string2file(text, path)
+  >>> shards = shard_boundaries(path, 4)
+  >>> len(shards), shards[0][0], shards[-1][1] == os.path.getsize(path)
+  (4, 0, True)
+  >>> data = open(path, 'rb').read()
+  >>> all(a[1] == b[0] and data[a[1]:a[1]+1].isspace() for (a, b) in zip(shards, shards[1:]))
+  True
+  >>> counts = Counter()
+  >>> for (start, end) in shards: counts = merge_histograms(counts, stream_histogram(byte_range_chunks(path, start, end, 5)))
+  >>> counts == histogram(get_words(text)) == parallel_histogram(path, 3)
+  True
+  >>> shutil.rmtree(directory)
+  """
+  if end is None:
+    end = os.path.getsize(path)
+  size = end - start
+  cuts = [start]
+  with open(path,'rb') as file:
+    for k in range(1, n):
+      pos = next_space(file, max(start + k*size//n, cuts[-1]), end)
+      if pos > cuts[-1]:
+        cuts.append(pos)
+  if cuts[-1] < end:
+    cuts.append(end)
+  return [(cuts[k], cuts[k+1]) for k in range(0, len(cuts)-1)]
+
+def last_space(path, size):
+  """Return the position just after the last whitespace byte
+  among the first size bytes of the file at path, or 0."""
+  with open(path,'rb') as file:
+    pos = size
+    while pos > 0:
+      start = max(0, pos - (1 << 16))
+      file.seek(start)
+      data = file.read(pos - start)
+      found = None
+      for m in SPACE_BYTE.finditer(data):
+        found = m.end()
+      if found is not None:
+        return start + found
+      pos = start
+  return 0
+
 def tally(key, dict):
   """Increase value of key by one if key is present,
   otherwise add the key and set its value to 1"""
@@ -39,85 +199,576 @@ def tally(key, dict):
   else:
     dict[key] = 1
 
-def histogram(words):
+def histogram(words, histo=None):
   """
   Return a historgram (dictionary) of word 
-  frequencies from the given list.
+  frequencies from the given list.  If histo is
+  given, add the counts to it instead of a new one.
+  Words appear in the dictionary in order of first 
+  occurrence, as with tally.
   """
-  histo = { }
-  for w in words:
-    tally(w, histo)
+  if histo is None:
+    histo = Counter()
+  histo.update(words)
   return histo
 
+def merge_histograms(A, B):
+  """Add the counts in histogram B to histogram A and return A.
+  Words of B not in A are added after those of A, so merging
+  the histograms of consecutive pieces of a text gives the
+  same order as counting the text in one go."""
+  A.update(B)
+  return A
+
+class Cleaner:
+  """Lower-case text and remove punctuation and digits.
+
+  Cleaner() does what get_words has always done.  The options:
+
+    casefold         -- use str.casefold instead of str.lower, so
+                        that e.g. 'STRASSE' and 'straße' agree
+    keep_apostrophes -- keep "'" so that "don't" stays "don't"
+    keep_digits      -- keep the digits 0-9
+
+  The translation tables are built once, when the Cleaner is made.
+  ASCII text (the usual case) is lower-cased and stripped in a single
+  translate pass; other text is lower-cased first, then stripped.
+  """
+
+  def __init__(self, casefold=False, keep_apostrophes=False, keep_digits=False):
+    self.casefold = casefold
+    self.key = "casefold=%s apostrophes=%s digits=%s" % (casefold, keep_apostrophes, keep_digits)
+    delete = string.punctuation
+    if keep_apostrophes:
+      delete = delete.replace("'", "")
+    if not keep_digits:
+      delete = delete + string.digits
+    self.ascii_table = str.maketrans(string.ascii_uppercase, string.ascii_lowercase, delete)
+    self.delete_table = str.maketrans('', '', delete)
+
+  def __call__(self, text):
+    if text.isascii():
+      return text.translate(self.ascii_table)
+    if self.casefold:
+      return text.casefold().translate(self.delete_table)
+    return text.lower().translate(self.delete_table)
+
+clean_text = Cleaner()    # the default cleaner
+
 def get_words(text):
   """Return a list of words after cleaning up the text."""
-  text = text.lower()
-  T = text.maketrans('', '', string.punctuation)
-  text = text.translate(T)
-  T = text.maketrans('', '', string.digits)
-  text = text.translate(T)
-  return text.split()
+  return clean_text(text).split()
+
+def chunk_words(chunks, junk=None, clean=clean_text):
+  """Yield one list of words for each chunk of text, cleaned up
+  by the function clean.  The text after the last whitespace of a
+  chunk, which may be a word cut in two, is held back and joined to
+  the start of the next chunk before it is cleaned: lower-casing 
+  depends on the letters around ('ΣΟΦΟΣ' gives 'σοφος', 'ΣΟΦ' 'σοφ'
+  and 'ΟΣ' 'ος'), so a word must be cleaned whole.  Words in the set
+  junk are left out.
+
+  >>> list(chunk_words(["ΣΟΦ", "ΟΣ Σο", "φος. The"]))
+  [[], ['σοφος'], ['σοφος'], ['the']]
+  """
+  carry = ""
+  for chunk in chunks:
+    text = carry + chunk
+    cut = len(text)
+    while cut > 0 and not text[cut-1].isspace():
+      cut = cut - 1
+    carry = text[cut:]
+    words = clean(text[:cut]).split()
+    if junk:
+      words = [w for w in words if w not in junk]
+    yield words
+  words = clean(carry).split()
+  if junk:
+    words = [w for w in words if w not in junk]
+  if words:
+    yield words
+
+def stream_histogram(chunks, junk=None, clean=clean_text):
+  """Return the histogram of the words in the given chunks of
+  text, leaving out the words in the set junk.  Same result as
+  histogram(get_words(text)), but the text is never held in
+  memory all at once."""
+  histo = Counter()
+  for words in chunk_words(chunks, junk, clean):
+    histogram(words, histo)
+  return histo
 
 def list_minus(A,B):
-  """Return list of items in A which are not in B."""
+  """Return list of items in A which are not in B.
+  B should be a set: for a list each test is a linear scan."""
   C = [ ]
   for item in A:
     if item not in B:
       C.append(item)
   return C
 
-def junk_filter(word_list, junk_word_file):
-  """Retun word_list minus words in the junk_word_file."""
+def count_shard(job):
+  """Worker: return the histogram of one byte range of a file.
+  job is a tuple (path, start, end, junk, clean)."""
+  path, start, end, junk, clean = job
+  return stream_histogram(byte_range_chunks(path, start, end), junk, clean)
+
+def merge_pair(pair):
+  """Worker: merge a list of one or two histograms."""
+  if len(pair) == 1:
+    return pair[0]
+  return merge_histograms(pair[0], pair[1])
+
+def parallel_histogram(path, workers, junk=None, start=0, end=None, clean=clean_text):
+  """Return the histogram of the file at path (or of bytes start..end),
+  counted by the given number of worker processes.  The partial
+  histograms are merged pairwise, neighbour with neighbour, until
+  one is left."""
+  shards = shard_boundaries(path, workers, start, end)
+  if len(shards) < 2:
+    return Counter() if not shards else count_shard((path,) + shards[0] + (junk, clean))
+  jobs = [(path, start, end, junk, clean) for (start, end) in shards]
+  with Pool(workers) as pool:
+    parts = pool.map(count_shard, jobs)
+    while len(parts) > 1:
+      pairs = [parts[k:k+2] for k in range(0, len(parts), 2)]
+      parts = pool.map(merge_pair, pairs)
+  return parts[0]
+
+def read_junk_words(junk_word_file):
+  """Return the list of words in the junk_word_file."""
   junkwords = file2string(junk_word_file)
   junk_words_list = junkwords.split()
   print("%d junk words read" % len(junk_words_list))
-  return list_minus(words, junk_words_list)
+  return junk_words_list
+
+def junk_filter(word_list, junk_word_file):
+  """Retun word_list minus words in the junk_word_file."""
+  return list_minus(word_list, set(read_junk_words(junk_word_file)))
+
+def stop_cache_path(junk_word_files):
+  """Return the name of the cache file for the given junk files."""
+  return junk_word_files[0] + '.stopcache'
+
+def junk_files_key(junk_word_files):
+  """Return a key which changes when any of the junk files changes."""
+  key = [ ]
+  for name in junk_word_files:
+    info = os.stat(name)
+    key.append([os.path.abspath(name), info.st_mtime_ns, info.st_size])
+  return key
+
+def read_stop_words(junk_word_files):
+  """Return the set of words in the given junk files.  The set is
+  taken from the cache file if the junk files have not changed since
+  it was written, otherwise it is built and the cache is rewritten.
+  The cache is JSON, {"key": ..., "words": [...]}, so reading one
+  left by someone else can do no more than give the wrong words."""
+  cache = stop_cache_path(junk_word_files)
+  key = junk_files_key(junk_word_files)
+  try:
+    with open(cache,'r') as file:
+      cached = json.load(file)
+    if cached['key'] == key:
+      stop_words = frozenset(w for w in cached['words'] if type(w) == str)
+      print("%d junk words read from %s" % (len(stop_words), cache))
+      return stop_words
+  except (OSError, ValueError, KeyError, TypeError):
+    pass
+  stop_words = set()
+  for name in junk_word_files:
+    stop_words.update(read_junk_words(name))
+  stop_words = frozenset(stop_words)
+  try:
+    temp = "%s.%d" % (cache, os.getpid())
+    with open(temp,'w') as file:
+      json.dump({'key': key, 'words': sorted(stop_words)}, file)
+    os.replace(temp, cache)
+  except OSError:
+    pass
+  return stop_words
+
+def index_path(path, directory=None):
+  """Return the name of the count index for the file at path, in
+  directory (by default the file's own).  In another directory the
+  name has a digest of the file's absolute path, so that a/x.log and
+  b/x.log have an index each."""
+  if directory is None:
+    return path + '.histo.idx'
+  digest = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:12]
+  return os.path.join(directory, "%s.%s.histo.idx" % (os.path.basename(path), digest))
+
+CHECK_SIZE = 1 << 16   # bytes covered by each index checksum
+
+def block_digest(path, start, end):
+  """Return the SHA-1 hex digest of bytes start..end of the file."""
+  with open(path,'rb') as file:
+    file.seek(start)
+    return hashlib.sha1(file.read(end - start)).hexdigest()
+
+def junk_key(junk, clean=clean_text):
+  """Return a digest identifying the set of junk words and
+  the way the text is cleaned up."""
+  words = sorted(junk) if junk else [ ]
+  words.append(clean.key)
+  return hashlib.sha1("\n".join(words).encode('utf-8')).hexdigest()
+
+def read_index(path, junk=None, clean=clean_text, directory=None):
+  """Return (offset, histogram) from the index of the file at path:
+  the histogram of the first offset bytes.  Return (0, empty histogram)
+  if there is no index, if it was made with other junk words, or if
+  the file no longer begins with the bytes that were counted.  The
+  index is in directory, as for index_path."""
+  try:
+    with open(index_path(path, directory),'r') as file:
+      index = json.load(file)
+  except (OSError, ValueError):
+    return 0, Counter()
+  offset = index['offset']
+  if index['junk'] != junk_key(junk, clean) or offset > os.path.getsize(path):
+    return 0, Counter()
+  if block_digest(path, 0, min(offset, CHECK_SIZE)) != index['head']:
+    return 0, Counter()
+  if block_digest(path, max(0, offset - CHECK_SIZE), offset) != index['tail']:
+    return 0, Counter()
+  return offset, Counter(index['counts'])
+
+def write_index(path, offset, histo, junk=None, clean=clean_text, directory=None):
+  """Save the histogram of the first offset bytes of the file at path,
+  in directory (see index_path)."""
+  index = { }
+  index['offset'] = offset
+  index['junk'] = junk_key(junk, clean)
+  index['head'] = block_digest(path, 0, min(offset, CHECK_SIZE))
+  index['tail'] = block_digest(path, max(0, offset - CHECK_SIZE), offset)
+  index['counts'] = histo
+  name = index_path(path, directory)
+  temp = "%s.%d" % (name, os.getpid())
+  with open(temp,'w') as file:
+    json.dump(index, file)
+  os.replace(temp, name)
+
+def indexed_histogram(path, junk=None, workers=1, clean=clean_text, directory=None):
+  """Return the histogram of the file at path, counting only the bytes
+  added since the index was last written, and update the index (kept
+  in directory, see index_path).
+  The index stops at the last whitespace in the file, so that a word
+  still being written is counted again in full next time.
+
+  >>> import tempfile, shutil
+  >>> directory = tempfile.mkdtemp()
+  >>> path = os.path.join(directory, 'server.log')
+  >>> string2file("alpha beta gamma\\n" * 10, path)
+  >>> indexed_histogram(path)['beta'], read_index(path)[0]
+  (10, 170)
+
+  A file which has grown is counted from where the index stops; a
+  word still being written is left for next time:
+
+  >>> with open(path, 'a') as file: n = file.write("beta delta\\nbet")
+  >>> indexed_histogram(path)['beta'], read_index(path)[0]
+  (11, 181)
+
+  An index made with other junk words, or another Cleaner, is not used:
+
+  >>> read_index(path, {'alpha'})[0], read_index(path, None, Cleaner(casefold=True))[0]
+  (0, 0)
+
+  Nor is it once the file is cut short, or rewritten:
+
+  >>> string2file("alpha beta\\n", path)
+  >>> read_index(path)[0], indexed_histogram(path)['beta'], read_index(path)[0]
+  (0, 1, 11)
+  >>> string2file("gamma beta\\n", path)
+  >>> read_index(path)[0], indexed_histogram(path)['gamma']
+  (0, 1)
+  >>> shutil.rmtree(directory)
+  """
+  size = os.path.getsize(path)
+  end = last_space(path, size)
+  offset, histo = read_index(path, junk, clean, directory)
+  if offset < end:
+    if workers > 1:
+      delta = parallel_histogram(path, workers, junk, offset, end, clean)
+    else:
+      delta = stream_histogram(byte_range_chunks(path, offset, end), junk, clean)
+    merge_histograms(histo, delta)
+    write_index(path, end, histo, junk, clean, directory)
+  elif offset > end:
+    histo = stream_histogram(byte_range_chunks(path, 0, end), junk, clean)
+    write_index(path, end, histo, junk, clean, directory)
+  if end < size:
+    tail = stream_histogram(byte_range_chunks(path, end, size), junk, clean)
+    histo = merge_histograms(Counter(histo), tail)
+  return histo
+
+def count_file(path, junk=None, workers=1, index=False, clean=clean_text):
+  """Return the histogram of the file at path, using the given
+  number of processes and, if index is true, the count index: next
+  to the file if index is True, otherwise in the directory index."""
+  if index:
+    directory = None if index is True else index
+    return indexed_histogram(path, junk, workers, clean, directory)
+  if workers > 1:
+    return parallel_histogram(path, workers, junk, clean=clean)
+  return stream_histogram(file_chunks(path), junk, clean)
 
 def sort_table(T):
   """Sort table by tuple item 1."""
   p1 = lambda x: -x[1]
   T.sort(key=p1)
 
-def relative_frequencies(table):
-  """Given table of pairs (item, frequency), return table of 
-  triples (item, frequeny, relative frequency)"""
+def top_table(histo, K):
+  """Return the K most frequent (item, frequency) pairs of the
+  histogram, in the same order as sort_table would put them.
+  Uses a heap of size K instead of sorting the whole table."""
+  return heapq.nlargest(K, histo.items(), key=lambda x: x[1])
+
+class SpaceSaving:
+  """Approximate word counts in fixed memory (the Space-Saving
+  algorithm of Metwally, Agrawal and El Abbadi).
+
+  At most capacity words are counted.  When a new word arrives and
+  the table is full, the word with the smallest count c is replaced
+  by the new word, which starts at c + 1 with error c.  For a stream
+  of N words:
+
+    - each count is at most error too high, and error <= N/capacity;
+    - every word occurring more than N/capacity times is in the table.
+
+  >>> summary = SpaceSaving(10)
+  >>> stream = [['a', 'b', 'w%d' % k] if k % 2 else ['a', 'w%d' % k] for k in range(100)]
+  >>> for words in stream: summary.add(words)
+  >>> exact = Counter(w for words in stream for w in words)
+  >>> summary.N, len(summary.counts), summary.max_error() <= summary.N / summary.capacity
+  (250, 10, True)
+  >>> all(exact[w] <= c <= exact[w] + e <= c + summary.max_error() for (w, c, e) in summary.top(10))
+  True
+  >>> [(w, c - e) for (w, c, e) in summary.top(2)]
+  [('a', 100), ('b', 50)]
+  """
+
+  def __init__(self, capacity):
+    self.capacity = capacity
+    self.counts = { }
+    self.errors = { }
+    self.heap = [ ]      # one (count, word) entry per word; count may lag
+    self.N = 0
+
+  def add(self, words):
+    """Count the words in the given list."""
+    for w, k in Counter(words).items():
+      self.update(w, k)
+
+  def update(self, w, k):
+    """Count k more occurrences of word w."""
+    self.N = self.N + k
+    counts = self.counts
+    if w in counts:
+      counts[w] = counts[w] + k
+    elif len(counts) < self.capacity:
+      counts[w] = k
+      self.errors[w] = 0
+      heapq.heappush(self.heap, (k, w))
+    else:
+      c = self.evict()
+      counts[w] = c + k
+      self.errors[w] = c
+      heapq.heappush(self.heap, (c + k, w))
+
+  def evict(self):
+    """Remove the word with the smallest count, return its count.
+    Heap entries whose count is out of date are refreshed and pushed
+    back until the smallest entry is an up-to-date one."""
+    while True:
+      c, w = heapq.heappop(self.heap)
+      if self.counts[w] == c:
+        del self.counts[w]
+        del self.errors[w]
+        return c
+      heapq.heappush(self.heap, (self.counts[w], w))
+
+  def max_error(self):
+    """Return the largest possible overcount of any word."""
+    if len(self.counts) < self.capacity:
+      return 0
+    return min(self.counts.values())
+
+  def top(self, K):
+    """Return the K largest (word, count, error) triples."""
+    best = heapq.nlargest(K, self.counts.items(), key=lambda x: x[1])
+    return [(w, c, self.errors[w]) for (w, c) in best]
+
+def relative_frequencies(table, N):
+  """Given table of pairs (item, frequency) and the total number
+  of words N, return table of triples (item, frequeny, relative frequency)"""
   newtable = [ ]
-  N = len(words)
   for item in table:
     f = 100*item[1]/N
     newitem = item + (f,)
     newtable.append(newitem)
   return newtable
 
-def print_table(T):
+def print_table(T, unique):
   """Print table with summary."""
   for entry in T:
     print("%15s %3d   %4.3f" % tuple(entry))
-  print("Number of unique words: %d" % len(table))
+  print("Number of unique words: %d" % unique)
+
+def print_approximate(summary, K):
+  """Print the K most frequent words of a SpaceSaving summary, with
+  a lower bound for each count."""
+  for (w, c, e) in summary.top(K):
+    print("%15s %3d   %4.3f   (at least %d)" % (w, c, 100*c/summary.N, c - e))
+  print("Number of words: %d" % summary.N)
+  print("Counts are at most %d too high (%d counters)" % (summary.max_error(), summary.capacity))
+
+BATCH_SIZE = 10000   # rows formatted per write
+
+row_formats = { }
+row_formats['text'] = "%15s %3d   %4.3f\n"
+row_formats['tsv'] = "%s\t%d\t%.6f\n"
+
+def write_rows(file, T, row_format):
+  """Write the rows of table T to an open text file, BATCH_SIZE
+  rows at a time."""
+  for k in range(0, len(T), BATCH_SIZE):
+    file.write("".join([row_format % tuple(entry) for entry in T[k:k+BATCH_SIZE]]))
 
-def write_output(name, T):
+BINARY_MAGIC = b'HSTO\x01'
+BINARY_HEADER = struct.Struct('<5sQQ')   # magic, number of words N, number of rows
+BINARY_ROW = struct.Struct('<QI')        # count, length of the UTF-8 word
+
+def write_binary(file, T):
+  """Write table T to an open binary file: a header with the total
+  count N and the number of rows, then for each row the count, the
+  length of the word in bytes and the word in UTF-8.  All integers
+  are little-endian."""
+  N = sum(entry[1] for entry in T)
+  file.write(BINARY_HEADER.pack(BINARY_MAGIC, N, len(T)))
+  for k in range(0, len(T), BATCH_SIZE):
+    batch = bytearray()
+    for entry in T[k:k+BATCH_SIZE]:
+      word = entry[0].encode('utf-8')
+      batch += BINARY_ROW.pack(entry[1], len(word))
+      batch += word
+    file.write(batch)
+
+def read_table(name):
+  """Read a histogram file written with format 'tsv' or 'bin' and
+  return the table of (word, count, relative frequency) triples.
+
+  >>> import tempfile, shutil
+  >>> directory = tempfile.mkdtemp()
+  >>> name = os.path.join(directory, 'raven.histo')
+  >>> table = relative_frequencies([('nevermore', 3), ('σοφος', 1)], 4)
+  >>> with open(name + '.bin', 'wb') as file: write_binary(file, table)
+  >>> with open(name + '.tsv', 'w', encoding='utf-8') as file: write_rows(file, table, row_formats['tsv'])
+  >>> read_table(name + '.bin') == read_table(name + '.tsv') == table
+  True
+  >>> table
+  [('nevermore', 3, 75.0), ('σοφος', 1, 25.0)]
+  >>> shutil.rmtree(directory)
+  """
+  with open(name,'rb') as file:
+    head = file.read(BINARY_HEADER.size)
+    if head[:len(BINARY_MAGIC)] == BINARY_MAGIC:
+      magic, N, rows = BINARY_HEADER.unpack(head)
+      data = file.read()
+      T = [ ]
+      pos = 0
+      for k in range(0, rows):
+        count, length = BINARY_ROW.unpack_from(data, pos)
+        pos = pos + BINARY_ROW.size
+        word = data[pos:pos+length].decode('utf-8')
+        pos = pos + length
+        T.append((word, count, 100*count/N))
+      return T
+  T = [ ]
+  with open(name,'r', encoding='utf-8') as file:
+    for line in file:
+      word, count, f = line.rstrip('\n').split('\t')
+      T.append((word, int(count), float(f)))
+  return T
+
+def output_name(path, format):
+  """Return the default histogram file name for the given format."""
+  if format == 'text':
+    return path + '.histo'
+  return path + '.histo.' + format
+
+def write_output(name, T, format='text'):
   """Write output for table T to file."""
-  output_filename = sys.argv[1]+'.histo'
-  output = ""
-  for entry in table:
-    output_entry = "%15s %3d   %4.3f" % tuple(entry)
-    output = output + output_entry + '\n'
-  string2file(output, output_filename)
+  output_filename = name
+  if format == 'bin':
+    with open(output_filename,'wb') as file:
+      write_binary(file, T)
+  elif format == 'tsv':
+    with open(output_filename,'w', encoding='utf-8') as file:
+      write_rows(file, T, row_formats[format])
+  else:
+    with open(output_filename,'w') as file:
+      write_rows(file, T, row_formats[format])
   print("Look in %s for full histogram" % output_filename)
 
 #############################################
 
-text = file2string(sys.argv[1])              # open text file
-words = get_words(text)                      # get word list
+def parse_args(argv):
+  """Parse the command line."""
+  parser = argparse.ArgumentParser(description="Histogram of word frequencies.")
+  parser.add_argument('files', nargs='+', metavar='file', help="text file(s) to count")
+  parser.add_argument('-o', dest='output', metavar='OUTPUT',
+                      help="histogram file (default: first file + .histo)")
+  parser.add_argument('-j', dest='junk', metavar='JUNKFILE', action='append',
+                      help="leave out the words listed in JUNKFILE (may be repeated)")
+  parser.add_argument('--workers', type=int, default=1, metavar='N',
+                      help="count the file in N processes")
+  parser.add_argument('--top', type=int, default=0, metavar='K',
+                      help="only print the K most frequent words, write no .histo file")
+  parser.add_argument('--approx', type=int, default=0, metavar='M',
+                      help="estimate the top words using M counters (single process)")
+  parser.add_argument('--index', action='store_true',
+                      help="keep a count index per file and count only new bytes")
+  parser.add_argument('--format', choices=['text', 'tsv', 'bin'], default='text',
+                      help="layout of the histogram file")
+  parser.add_argument('--casefold', action='store_true',
+                      help="fold case with str.casefold instead of str.lower")
+  parser.add_argument('--keep-apostrophes', action='store_true',
+                      help="do not remove apostrophes")
+  parser.add_argument('--keep-digits', action='store_true',
+                      help="do not remove digits")
+  return parser.parse_args(argv)
+
+if __name__ == "__main__":
+  args = parse_args(sys.argv[1:])
+  clean = Cleaner(args.casefold, args.keep_apostrophes, args.keep_digits)
+  junk = None
+  if args.junk:                                # filter out junk words
+    junk = read_stop_words(args.junk)
+
+  if args.approx:                              # fixed-memory estimate of top words
+    summary = SpaceSaving(args.approx)
+    for name in args.files:
+      for words in chunk_words(file_chunks(name), junk, clean):
+        summary.add(words)
+    print_approximate(summary, args.top or 10)
+    sys.exit(0)
+
+  output = args.output or output_name(args.files[0], args.format)
+  index = args.index and os.path.dirname(os.path.abspath(output))  # indexes go with the output
+  h = Counter()                                # make dictionary of word frequencies
+  for name in args.files:
+    merge_histograms(h, count_file(name, junk, args.workers, index, clean))
+  N = sum(h.values())                          # number of words counted
+
+  if args.top:                                 # top words only, no full sort
+    table = relative_frequencies(top_table(h, args.top), N)
+    print_table(table, len(h))
+    sys.exit(0)
 
-if (len(sys.argv) > 2):
-  if (sys.argv[2] == "-j"):                     # filter out junk words
-    words = junk_filter(words, sys.argv[3])
-  
-h = histogram(words)                         # make dictionary of word frequencies
-table = list(h.items())                      # convert dictionary to a list
-sort_table(table)                            # sort the table
-table = relative_frequencies(table)          # compute relative frequencies
+  table = list(h.items())                      # convert dictionary to a list
+  sort_table(table)                            # sort the table
+  table = relative_frequencies(table, N)       # compute relative frequencies
 
-print_table(table[:10])                      # output to terminal  -- top 10 words
-write_output(sys.argv[1]+'.histo', table)    # output to file      -- everything
+  print_table(table[:10], len(table))          # output to terminal  -- top 10 words
+  write_output(output, table, args.format)     # output to file      -- everything
@@ -20,10 +20,11 @@ def repeat(T, f, N, A, S, k):
     T.left(A)
     S = k*S
 
-from turtle import *
-from utilities import saveImage
-fred = Turtle()
-fred.speed("fastest")     
-repeat(fred, square, 108, 10, 200, 0.97)
-saveImage(fred, "nautilus.eps")
-exitonclick()
+from utilities import saveImage, new_turtle
+
+if __name__ == "__main__":
+  fred = new_turtle()
+  fred.speed("fastest")     
+  repeat(fred, square, 108, 10, 200, 0.97)
+  saveImage(fred, "nautilus.eps")
+  fred.getscreen().exitonclick()
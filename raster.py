@@ -0,0 +1,310 @@
+# file: raster.py
+"""
+raster.py: rasterize the fractal stars of star.py and cross.py at any
+size, tile by tile, into a tiled TIFF file.
+
+Usage:
+
+  % python3 raster.py 4 8 -o star8.tif --size 20000
+  % python3 raster.py 4 5 -f 0.4 -o cross5.tif --size 100000 --workers 8
+
+The first draws the star of star.py with 4 rays and depth 8 on an image
+20000 pixels across; the second the cross of cross.py (f = 0.4) of depth
+5 on a 100000 x 100000 pixel image -- ten gigapixels.
+
+The image is cut into square tiles of TILE pixels.  A row of tiles at
+a time, the segments which meet the row are binned into the tiles they
+cross (bin_segments: an index sorted by tile, so each tile's segments
+are one slice), and each tile draws only its own, clipped to the tile.
+Lines are anti-aliased: a tile is drawn at SUPERSAMPLE x SUPERSAMPLE
+points per pixel and averaged.  Tiles are drawn in a pool of processes,
+a window of tiles at a time, and each is compressed and appended to the
+file as soon as it is done, so memory use depends on the tile size and
+the number of segments, not on the size of the image.  The file is a
+tiled, deflate-compressed TIFF (a BigTIFF above 4 GB uncompressed),
+which image viewers and libraries such as libtiff, Pillow and vips read
+tile by tile.
+"""
+import sys, os, math, struct, zlib, argparse
+
+TILE = 512
+SUPERSAMPLE = 4
+CHUNK_POINTS = 1 << 20     # points drawn at a time in a tile
+
+def image_transform(segments, size, margin=10):
+  """Return (scale, xmin, ymax, width, height): drawing coordinates x, y
+  go to pixel (x - xmin) * scale, (ymax - y) * scale, on an image of
+  width x height pixels whose longer side is size."""
+  xmin = min(segments[:, 0].min(), segments[:, 2].min())
+  xmax = max(segments[:, 0].max(), segments[:, 2].max())
+  ymin = min(segments[:, 1].min(), segments[:, 3].min())
+  ymax = max(segments[:, 1].max(), segments[:, 3].max())
+  scale = (size - 2 * margin) / max(xmax - xmin, ymax - ymin, 1e-9)
+  width = int(math.ceil((xmax - xmin) * scale)) + 2 * margin
+  height = int(math.ceil((ymax - ymin) * scale)) + 2 * margin
+  return scale, xmin - margin / scale, ymax + margin / scale, width, height
+
+def tile_rows(pixels, rows, tile, pad):
+  """Return (first, last): the rows of tiles (of rows) each segment, rows
+  x0 y0 x1 y1 in pixels, meets when widened by pad."""
+  import numpy
+  y0 = numpy.minimum(pixels[:, 1], pixels[:, 3]) - pad
+  y1 = numpy.maximum(pixels[:, 1], pixels[:, 3]) + pad
+  first = numpy.clip(numpy.floor(y0 / tile), 0, rows - 1).astype(numpy.int64)
+  last = numpy.clip(numpy.floor(y1 / tile), 0, rows - 1).astype(numpy.int64)
+  return first, last
+
+def bin_segments(pixels, columns, rows, tile, pad, band=None):
+  """Bin segments (rows x0 y0 x1 y1, in pixels) into the tiles of a grid of
+  columns x rows tiles: return (order, starts), the segments of tile k
+  (numbered row by row) being pixels[order[starts[k]:starts[k+1]]].  With
+  band, a pair (top, bottom), only the rows top .. bottom - 1 are binned,
+  and tile k is the k-th of those.  A segment goes into the tiles it
+  crosses, widened by pad: for each row of tiles, those spanned by the
+  part of it within the row (widened by pad).  So a long diagonal goes
+  into about length / tile tiles, not (length / tile)**2."""
+  import numpy
+  top, bottom = band or (0, rows)
+  first, last = tile_rows(pixels, rows, tile, pad)
+  first = numpy.maximum(first, top)
+  last = numpy.minimum(last, bottom - 1)
+  # One (segment, row of tiles) pair for each row a segment meets.
+  counts = numpy.maximum(last - first + 1, 0)
+  segment = numpy.repeat(numpy.arange(len(pixels)), counts)
+  row = first[segment] + numpy.arange(len(segment)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+  # The part of the segment within the row, widened by pad: t from 0 at
+  # its start to 1 at its end (an end, if the segment is only within pad).
+  s = pixels[segment]
+  dy = s[:, 3] - s[:, 1]
+  with numpy.errstate(divide='ignore', invalid='ignore'):
+    ta = (row * tile - pad - s[:, 1]) / dy
+    tb = ((row + 1) * tile + pad - s[:, 1]) / dy
+  flat = dy == 0
+  ta[flat], tb[flat] = 0, 1
+  ta, tb = numpy.clip(numpy.minimum(ta, tb), 0, 1), numpy.clip(numpy.maximum(ta, tb), 0, 1)
+  xa = s[:, 0] + ta * (s[:, 2] - s[:, 0])
+  xb = s[:, 0] + tb * (s[:, 2] - s[:, 0])
+  left = numpy.clip(numpy.floor((numpy.minimum(xa, xb) - pad) / tile), 0, columns - 1).astype(numpy.int64)
+  right = numpy.clip(numpy.floor((numpy.maximum(xa, xb) + pad) / tile), 0, columns - 1).astype(numpy.int64)
+  del s, dy, ta, tb, xa, xb
+  # One entry for each tile of the row it spans.
+  across = right - left + 1
+  entry = numpy.repeat(numpy.arange(len(segment)), across)
+  k = numpy.arange(len(entry)) - numpy.repeat(numpy.cumsum(across) - across, across)
+  tiles = (row[entry] - top) * columns + left[entry] + k
+  order = numpy.argsort(tiles, kind='stable')
+  starts = numpy.searchsorted(tiles[order], numpy.arange((bottom - top) * columns + 1))
+  return segment[entry[order]], starts
+
+def clip_segments(s, lo, hi):
+  """Clip segments (rows x0 y0 x1 y1) to the box lo <= (x, y) <= hi
+  (Liang-Barsky): return the indices of those that meet it, and where
+  each enters and leaves it, t0 <= t1, from 0 at the start to 1 at the
+  end."""
+  import numpy
+  d = s[:, 2:] - s[:, :2]
+  t0 = numpy.zeros(len(s))
+  t1 = numpy.ones(len(s))
+  for k in (0, 1):
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+      a = (lo[k] - s[:, k]) / d[:, k]
+      b = (hi[k] - s[:, k]) / d[:, k]
+    flat = d[:, k] == 0
+    inside = (s[:, k] >= lo[k]) & (s[:, k] <= hi[k])
+    a[flat] = numpy.where(inside[flat], -numpy.inf, numpy.inf)
+    b[flat] = numpy.where(inside[flat], numpy.inf, -numpy.inf)
+    t0 = numpy.maximum(t0, numpy.minimum(a, b))
+    t1 = numpy.minimum(t1, numpy.maximum(a, b))
+  keep = numpy.flatnonzero(t0 <= t1)
+  return keep, t0[keep], t1[keep]
+
+def render_tile(job):
+  """Draw one tile: job is (segments in pixels, the tile's top left
+  pixel, tile size, line width in pixels, color or None for gray);
+  return its pixels, compressed."""
+  import numpy
+  segments, origin, tile, line, color = job
+  if len(segments) == 0:
+    return blank_tile(tile, color is not None)
+  n = tile * SUPERSAMPLE
+  radius = line * SUPERSAMPLE / 2
+  r = int(math.ceil(radius))
+  dy, dx = numpy.mgrid[-r:r+1, -r:r+1]
+  disk = (dx**2 + dy**2) <= max(radius, 0.5)**2
+  dx, dy = dx[disk], dy[disk]
+  s = segments * SUPERSAMPLE
+  # Points along each segment, at most a subpixel apart, numbered along
+  # the whole segment so that a line is drawn the same in every tile.
+  gaps = numpy.ceil(numpy.abs(s[:, 2:] - s[:, :2]).max(axis=1)).astype(numpy.int64)
+  ox, oy = origin[0] * SUPERSAMPLE, origin[1] * SUPERSAMPLE
+  keep, t0, t1 = clip_segments(s, (ox - r - 1, oy - r - 1), (ox + n + r + 1, oy + n + r + 1))
+  if len(keep) == 0:
+    return blank_tile(tile, color is not None)
+  s, gaps = s[keep], numpy.maximum(gaps[keep], 1)
+  mask = numpy.zeros((n, n), dtype=bool)
+  first = numpy.ceil(t0 * gaps).astype(numpy.int64)
+  count = numpy.maximum(numpy.floor(t1 * gaps).astype(numpy.int64) - first + 1, 0)
+  # A chunk of segments at a time, of about CHUNK_POINTS points.
+  ends = numpy.cumsum(count)
+  cuts = numpy.searchsorted(ends, numpy.arange(CHUNK_POINTS, ends[-1] if len(ends) else 0, CHUNK_POINTS)) + 1
+  bounds = [0] + sorted(set(cuts.tolist())) + [len(s)]
+  for a, b in zip(bounds[:-1], bounds[1:]):
+    c = count[a:b]
+    segment = numpy.repeat(numpy.arange(a, b), c)
+    j = numpy.arange(len(segment)) - numpy.repeat(numpy.cumsum(c) - c, c) + first[segment]
+    t = j / gaps[segment]
+    x = numpy.floor(s[segment, 0] + t * (s[segment, 2] - s[segment, 0])).astype(numpy.int64) - ox
+    y = numpy.floor(s[segment, 1] + t * (s[segment, 3] - s[segment, 1])).astype(numpy.int64) - oy
+    for ex, ey in zip(dx, dy):
+      px = x + ex
+      py = y + ey
+      ok = (px >= 0) & (px < n) & (py >= 0) & (py < n)
+      mask[py[ok], px[ok]] = True
+  coverage = mask.reshape(tile, SUPERSAMPLE, tile, SUPERSAMPLE).sum(axis=(1, 3), dtype=numpy.int32)
+  coverage = coverage / SUPERSAMPLE**2
+  if color is None:
+    pixels = 255 - numpy.round(255 * coverage)
+  else:
+    ink = numpy.array(color, dtype=float) * 255
+    pixels = numpy.round(255 + coverage[:, :, None] * (ink - 255))
+  return zlib.compress(pixels.astype(numpy.uint8).tobytes(), 6)
+
+blank_tiles = { }
+
+def blank_tile(tile, color):
+  """A white tile, compressed; most tiles of a large figure are blank."""
+  if (tile, color) not in blank_tiles:
+    blank_tiles[(tile, color)] = zlib.compress(b'\xff' * (tile * tile * (3 if color else 1)), 6)
+  return blank_tiles[(tile, color)]
+
+class TiledTiff:
+  """Write a tiled, deflate-compressed 8-bit TIFF tile by tile, in order
+  (left to right, top to bottom); the directory is written by close."""
+
+  def __init__(self, path, width, height, tile, samples=1):
+    self.width = width
+    self.height = height
+    self.tile = tile
+    self.samples = samples
+    self.big = width * height * samples > 0xff000000
+    self.file = open(path, 'wb')
+    if self.big:
+      self.file.write(struct.pack('<2sHHHQ', b'II', 43, 8, 0, 0))
+    else:
+      self.file.write(struct.pack('<2sHI', b'II', 42, 0))
+    self.offsets = [ ]
+    self.counts = [ ]
+
+  def write_tile(self, data):
+    self.offsets.append(self.file.tell())
+    self.counts.append(len(data))
+    self.file.write(data)
+
+  def close(self):
+    SHORT, LONG, LONG8 = 3, 4, 16
+    offset_type = LONG8 if self.big else LONG
+    tags = [(256, LONG, [self.width]), (257, LONG, [self.height]),
+            (258, SHORT, [8] * self.samples), (259, SHORT, [8]),
+            (262, SHORT, [1 if self.samples == 1 else 2]), (277, SHORT, [self.samples]),
+            (284, SHORT, [1]), (322, LONG, [self.tile]), (323, LONG, [self.tile]),
+            (324, offset_type, self.offsets), (325, offset_type, self.counts)]
+    codes = {SHORT: 'H', LONG: 'I', LONG8: 'Q'}
+    inline = 8 if self.big else 4
+    entries = [ ]
+    for tag, kind, values in tags:
+      data = struct.pack('<%d%s' % (len(values), codes[kind]), *values)
+      if len(data) <= inline:
+        entries.append((tag, kind, len(values), data.ljust(inline, b'\0')))
+      else:
+        if self.file.tell() % 2:
+          self.file.write(b'\0')
+        position = self.file.tell()
+        self.file.write(data)
+        entries.append((tag, kind, len(values), struct.pack('<Q' if self.big else '<I', position)))
+    if self.file.tell() % 2:
+      self.file.write(b'\0')
+    directory = self.file.tell()
+    if self.big:
+      self.file.write(struct.pack('<Q', len(entries)))
+      for tag, kind, count, value in entries:
+        self.file.write(struct.pack('<HHQ', tag, kind, count) + value)
+      self.file.write(struct.pack('<Q', 0))
+      self.file.seek(8)
+      self.file.write(struct.pack('<Q', directory))
+    else:
+      self.file.write(struct.pack('<H', len(entries)))
+      for tag, kind, count, value in entries:
+        self.file.write(struct.pack('<HHI', tag, kind, count) + value)
+      self.file.write(struct.pack('<I', 0))
+      self.file.seek(4)
+      self.file.write(struct.pack('<I', directory))
+    self.file.close()
+
+def rasterize(segments, path, size, line=1, color=None, tile=TILE, workers=None):
+  """Draw segments (rows x0 y0 x1 y1, in drawing coordinates) on an image
+  size pixels across, with lines line pixels wide, in gray or in color
+  (an r, g, b triple, 0..1), and write it to path as a tiled TIFF; see
+  above.  Return (width, height) of the image."""
+  import numpy
+  if tile % 16 != 0:
+    raise ValueError("rasterize: the tile size must be a multiple of 16")
+  segments = numpy.asarray(segments, dtype=float).reshape(-1, 4)
+  scale, xmin, ymax, width, height = image_transform(segments, size)
+  pixels = numpy.column_stack(((segments[:, 0] - xmin) * scale, (ymax - segments[:, 1]) * scale,
+                               (segments[:, 2] - xmin) * scale, (ymax - segments[:, 3]) * scale))
+  columns = (width + tile - 1) // tile
+  rows = (height + tile - 1) // tile
+  pad = line / 2 + 1
+  first, last = tile_rows(pixels, rows, tile, pad)
+  by_first = numpy.argsort(first, kind='stable')
+  row_starts = numpy.searchsorted(first[by_first], numpy.arange(rows + 1))
+
+  def jobs():
+    # A row of tiles at a time: bin the segments which meet the row (those
+    # met before, not yet left behind, and those which start there).
+    active = numpy.zeros(0, dtype=numpy.int64)
+    for r in range(0, rows):
+      active = numpy.concatenate((active[last[active] >= r], by_first[row_starts[r]:row_starts[r+1]]))
+      band = pixels[active]
+      order, starts = bin_segments(band, columns, rows, tile, pad, (r, r + 1))
+      for c in range(0, columns):
+        yield (band[order[starts[c]:starts[c+1]]], (c * tile, r * tile), tile, line, color)
+
+  out = TiledTiff(path, width, height, tile, 1 if color is None else 3)
+  tiles = jobs()
+  if workers == 1:
+    for job in tiles:
+      out.write_tile(render_tile(job))
+  else:
+    from multiprocessing import Pool
+    from itertools import islice
+    with Pool(workers) as pool:
+      # A window of tiles at a time, so that few wait in memory.
+      window = 4 * (workers or os.cpu_count() or 1)
+      while True:
+        batch = list(islice(tiles, window))
+        if not batch:
+          break
+        for data in pool.imap(render_tile, batch):
+          out.write_tile(data)
+  out.close()
+  return width, height
+
+def main(argv):
+  parser = argparse.ArgumentParser(description="Rasterize a fractal star into a tiled TIFF")
+  parser.add_argument("rays", type=int)
+  parser.add_argument("depth", type=int)
+  parser.add_argument("-f", type=float, default=0.3, help="rescaling factor (0.3 in star.py, 0.4 in cross.py)")
+  parser.add_argument("-o", "--output", default="star.tif")
+  parser.add_argument("--size", type=int, default=10000, help="pixels across")
+  parser.add_argument("--line", type=float, default=1, help="line width in pixels")
+  parser.add_argument("--tile", type=int, default=TILE, help="tile size in pixels (a multiple of 16)")
+  parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+  args = parser.parse_args(argv)
+  from geometry import star_segments, simplify
+  segments = simplify(star_segments(args.rays, 200, args.depth, args.f))
+  width, height = rasterize(segments, args.output, args.size, args.line, None, args.tile, args.workers)
+  print("%s: %d x %d pixels, %d segments" % (args.output, width, height, len(segments)))
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
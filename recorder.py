@@ -0,0 +1,393 @@
+# file: recorder.py
+"""
+A turtle which records what it draws instead of showing it, so that
+the drawing scripts can run without a display:
+
+  >>> from recorder import RecordingTurtle
+  >>> fred = RecordingTurtle()
+  >>> for k in range(0, 4):
+  ...   fred.forward(100)
+  ...   fred.left(90)
+  >>> len(fred)
+  4
+
+and fred.save("square.svg") writes the square to a file (or .eps, .png).
+
+RecordingTurtle has the turtle calls used in this repository: forward,
+backward, left, right, goto, penup, pendown, color, pensize, dot, ...
+getscreen() returns the turtle itself, so that utilities.saveImage and
+exitonclick work unchanged; utilities.new_turtle() picks a Tk Turtle or
+a RecordingTurtle depending on whether there is a display.
+
+Segments are kept in one flat array of coordinates, x0 y0 x1 y1 for
+each segment, with a parallel array of style numbers: a style is a
+(color, pen width) pair, kept once in the list 'styles'.
+"""
+
+import math, struct, zlib
+from array import array
+
+# RGB values, 0..1, of the color names used with turtles; others are drawn black
+# (except in SVG, which knows them).
+color_names = {'black': (0, 0, 0), 'white': (1, 1, 1), 'red': (1, 0, 0),
+               'green': (0, 0.5, 0), 'blue': (0, 0, 1), 'yellow': (1, 1, 0),
+               'orange': (1, 0.65, 0), 'purple': (0.63, 0.13, 0.94),
+               'gray': (0.75, 0.75, 0.75), 'grey': (0.75, 0.75, 0.75),
+               'brown': (0.65, 0.16, 0.16), 'pink': (1, 0.75, 0.8),
+               'cyan': (0, 1, 1), 'magenta': (1, 0, 1)}
+
+def rgb(color):
+  """Return the (r, g, b) values, 0..1, of a color: a name, '#rrggbb' or
+  a triple of numbers 0..1."""
+  if isinstance(color, str):
+    if color.startswith('#') and len(color) == 7:
+      return tuple(int(color[k:k+2], 16) / 255 for k in (1, 3, 5))
+    return color_names.get(color.lower(), (0, 0, 0))
+  return tuple(color)
+
+class RecordingTurtle:
+  """A turtle which records its segments and dots, see above."""
+
+  def __init__(self):
+    self.x = 0.0
+    self.y = 0.0
+    self.angle = 0.0       # heading, degrees counterclockwise from east
+    self.down = True
+    self.pen_color = 'black'
+    self.fill_color = 'black'
+    self.pen_width = 1
+    self.mode = 1.0        # colormode
+    self.segments = array('d')
+    self.segment_styles = array('I')
+    self.dots = array('d')           # x y size for each dot
+    self.dot_colors = [ ]
+    self.styles = [ ]
+    self.style_numbers = { }
+    self.style = None
+
+  def __len__(self):
+    """The number of segments drawn."""
+    return len(self.segment_styles)
+
+  # MOVING
+
+  def line_to(self, x, y):
+    if self.down:
+      if self.style is None:
+        self.style = self.style_number(self.pen_color, self.pen_width)
+      self.segments.extend((self.x, self.y, x, y))
+      self.segment_styles.append(self.style)
+    self.x = x
+    self.y = y
+
+  def draw_segments(self, segments):
+    """Draw many segments in one call, in the current pen color and width,
+    whatever the pen and position: segments is a flat sequence x0 y0 x1 y1
+    ..., or a float64 array of shape (m, 4) as from geometry.star_segments."""
+    if hasattr(segments, 'tobytes'):
+      coords = array('d')
+      coords.frombytes(segments.tobytes())
+    else:
+      coords = array('d', segments)
+    if len(coords) % 4 != 0:
+      raise ValueError("draw_segments: need 4 coordinates per segment")
+    if self.style is None:
+      self.style = self.style_number(self.pen_color, self.pen_width)
+    self.segments.extend(coords)
+    self.segment_styles.extend(array('I', [self.style]) * (len(coords) // 4))
+
+  def forward(self, distance):
+    a = math.radians(self.angle)
+    self.line_to(self.x + distance * math.cos(a), self.y + distance * math.sin(a))
+
+  def backward(self, distance):
+    self.forward(-distance)
+
+  def left(self, angle):
+    self.angle = (self.angle + angle) % 360
+
+  def right(self, angle):
+    self.left(-angle)
+
+  fd = forward
+  bk = back = backward
+  lt = left
+  rt = right
+
+  def goto(self, x, y=None):
+    if y is None:
+      x, y = x
+    self.line_to(float(x), float(y))
+
+  setpos = setposition = goto
+
+  def home(self):
+    self.goto(0, 0)
+    self.angle = 0.0
+
+  def setheading(self, angle):
+    self.angle = angle % 360
+
+  seth = setheading
+
+  def position(self):
+    return (self.x, self.y)
+
+  pos = position
+
+  def heading(self):
+    return self.angle
+
+  # PEN
+
+  def penup(self):
+    self.down = False
+
+  def pendown(self):
+    self.down = True
+
+  pu = up = penup
+  pd = down = pendown
+
+  def isdown(self):
+    return self.down
+
+  def color_value(self, color):
+    """A color as given to color(), in colormode 1.0."""
+    if isinstance(color, str):
+      return color
+    if self.mode != 1.0:
+      color = tuple(c / self.mode for c in color)
+    return tuple(color)
+
+  def pencolor(self, *color):
+    if not color:
+      return self.pen_color
+    self.pen_color = self.color_value(color[0] if len(color) == 1 else color)
+    self.style = None
+
+  def fillcolor(self, *color):
+    if not color:
+      return self.fill_color
+    self.fill_color = self.color_value(color[0] if len(color) == 1 else color)
+
+  def color(self, *colors):
+    """color(), color(c), color(pen, fill) or color(r, g, b), as for turtles."""
+    if not colors:
+      return (self.pen_color, self.fill_color)
+    if len(colors) == 2:
+      self.pencolor(colors[0])
+      self.fillcolor(colors[1])
+    else:
+      self.pencolor(*colors)
+      self.fillcolor(*colors)
+
+  def pensize(self, width=None):
+    if width is None:
+      return self.pen_width
+    self.pen_width = width
+    self.style = None
+
+  width = pensize
+
+  def dot(self, size=None, *color):
+    if size is None:
+      size = max(self.pen_width + 4, 2 * self.pen_width)
+    color = self.color_value(color[0] if len(color) == 1 else color) if color else self.pen_color
+    self.dots.extend((self.x, self.y, size))
+    self.dot_colors.append(color)
+
+  def style_number(self, color, width):
+    key = (color, width)
+    if key not in self.style_numbers:
+      self.style_numbers[key] = len(self.styles)
+      self.styles.append(key)
+    return self.style_numbers[key]
+
+  # THE TK TURTLE'S SCREEN, CANVAS AND ANIMATION: nothing to do
+
+  def speed(self, speed=None):
+    pass
+
+  def hideturtle(self):
+    pass
+
+  def showturtle(self):
+    pass
+
+  ht = hideturtle
+  st = showturtle
+
+  def getscreen(self):
+    return self
+
+  def getcanvas(self):
+    return self
+
+  def colormode(self, mode=None):
+    if mode is None:
+      return self.mode
+    self.mode = mode
+
+  def exitonclick(self):
+    pass
+
+  def postscript(self, file):
+    """As the Tk canvas does: write the drawing to file, as EPS."""
+    self.save(file, 'eps')
+
+  # OUTPUT
+
+  def paths(self):
+    """Yield (style, points) for each chain of segments of one style,
+    each starting where the one before it ended."""
+    s = self.segments
+    styles = self.segment_styles
+    points = [ ]
+    style = None
+    for k in range(0, len(styles)):
+      x0, y0, x1, y1 = s[4*k], s[4*k+1], s[4*k+2], s[4*k+3]
+      if styles[k] != style or not points or points[-1] != (x0, y0):
+        if points:
+          yield style, points
+        style = styles[k]
+        points = [(x0, y0)]
+      points.append((x1, y1))
+    if points:
+      yield style, points
+
+  def simplify(self, tolerance=1e-6):
+    """Replace the segments by fewer, longer ones which draw the same
+    picture (geometry.simplify, which needs NumPy), run by run of one
+    style; return the number of segments before and after."""
+    import numpy
+    from geometry import simplify
+    before = len(self)
+    s = numpy.array(self.segments).reshape(-1, 4)
+    styles = self.segment_styles
+    segments = array('d')
+    segment_styles = array('I')
+    start = 0
+    for k in range(1, before + 1):
+      if k == before or styles[k] != styles[start]:
+        merged = simplify(s[start:k], tolerance)
+        segments.frombytes(merged.tobytes())
+        segment_styles.extend(array('I', [styles[start]]) * len(merged))
+        start = k
+    self.segments = segments
+    self.segment_styles = segment_styles
+    return before, len(self)
+
+  def bounds(self, margin=10):
+    """Return (xmin, ymin, xmax, ymax) of the drawing, with a margin."""
+    xs = self.segments[0::2] + self.dots[0::3]
+    ys = self.segments[1::2] + self.dots[1::3]
+    if len(xs) == 0:
+      return (-margin, -margin, margin, margin)
+    return (min(xs) - margin, min(ys) - margin, max(xs) + margin, max(ys) + margin)
+
+  def save(self, filename, format=None):
+    """Write the drawing to filename: EPS, SVG or PNG, according to
+    format or else to the extension of filename."""
+    if format is None:
+      format = filename.rsplit('.', 1)[-1].lower()
+    writers = {'eps': write_eps, 'ps': write_eps, 'svg': write_svg, 'png': write_png}
+    if format not in writers:
+      raise ValueError("unknown image format: %s" % format)
+    writers[format](self, filename)
+
+def write_eps(turtle, filename):
+  xmin, ymin, xmax, ymax = turtle.bounds()
+  with open(filename, 'w') as file:
+    file.write("%!PS-Adobe-3.0 EPSF-3.0\n")
+    file.write("%%%%BoundingBox: 0 0 %d %d\n" % (math.ceil(xmax - xmin), math.ceil(ymax - ymin)))
+    file.write("%%EndComments\n")
+    file.write("1 setlinecap 1 setlinejoin\n%.2f %.2f translate\n" % (-xmin, -ymin))
+    current = None
+    for style, points in turtle.paths():
+      if style != current:
+        color, width = turtle.styles[style]
+        file.write("%.3f %.3f %.3f setrgbcolor %g setlinewidth\n" % (rgb(color) + (width,)))
+        current = style
+      file.write("newpath\n")
+      for k in range(0, len(points)):
+        file.write("%.2f %.2f %s\n" % (points[k][0], points[k][1], "lineto" if k else "moveto"))
+        # Keep paths short for old PostScript interpreters.
+        if k % 1000 == 999 and k + 1 < len(points):
+          file.write("stroke newpath %.2f %.2f moveto\n" % points[k])
+      file.write("stroke\n")
+    d = turtle.dots
+    for k in range(0, len(turtle.dot_colors)):
+      file.write("%.3f %.3f %.3f setrgbcolor " % rgb(turtle.dot_colors[k]))
+      file.write("newpath %.2f %.2f %.2f 0 360 arc fill\n" % (d[3*k], d[3*k+1], d[3*k+2] / 2))
+    file.write("showpage\n%%EOF\n")
+
+def svg_color(color):
+  if isinstance(color, str):
+    return color
+  return "rgb(%d,%d,%d)" % tuple(round(255 * c) for c in color)
+
+def write_svg(turtle, filename):
+  xmin, ymin, xmax, ymax = turtle.bounds()
+  with open(filename, 'w') as file:
+    file.write('<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="%.2f %.2f %.2f %.2f">\n'
+               % (math.ceil(xmax - xmin), math.ceil(ymax - ymin), xmin, -ymax, xmax - xmin, ymax - ymin))
+    file.write('<rect x="%.2f" y="%.2f" width="100%%" height="100%%" fill="white"/>\n' % (xmin, -ymax))
+    # y is up for turtles, down in SVG.
+    for style, points in turtle.paths():
+      color, width = turtle.styles[style]
+      d = " L ".join("%.2f %.2f" % (x, -y) for (x, y) in points)
+      file.write('<path fill="none" stroke="%s" stroke-width="%g" stroke-linecap="round" '
+                 'stroke-linejoin="round" d="M %s"/>\n' % (svg_color(color), width, d))
+    d = turtle.dots
+    for k in range(0, len(turtle.dot_colors)):
+      file.write('<circle cx="%.2f" cy="%.2f" r="%.2f" fill="%s"/>\n'
+                 % (d[3*k], -d[3*k+1], d[3*k+2] / 2, svg_color(turtle.dot_colors[k])))
+    file.write('</svg>\n')
+
+def write_png(turtle, filename):
+  """Rasterize the drawing at one pixel per turtle step, on white."""
+  xmin, ymin, xmax, ymax = turtle.bounds()
+  W = math.ceil(xmax - xmin)
+  H = math.ceil(ymax - ymin)
+  pixels = bytearray(b'\xff' * (3 * W * H))
+  colors = [bytes(round(255 * c) for c in rgb(color)) for (color, width) in turtle.styles]
+
+  def stamp(px, py, r, color):
+    # A square of side 2r+1 (a pixel for r = 0) centred at px, py.
+    for y in range(max(py - r, 0), min(py + r + 1, H)):
+      row = 3 * W * y
+      for x in range(max(px - r, 0), min(px + r + 1, W)):
+        pixels[row + 3*x : row + 3*x + 3] = color
+
+  s = turtle.segments
+  styles = turtle.segment_styles
+  for k in range(0, len(styles)):
+    color = colors[styles[k]]
+    r = int(turtle.styles[styles[k]][1]) // 2
+    x0 = s[4*k] - xmin; y0 = ymax - s[4*k+1]
+    x1 = s[4*k+2] - xmin; y1 = ymax - s[4*k+3]
+    n = int(max(abs(x1 - x0), abs(y1 - y0))) + 1
+    for j in range(0, n + 1):
+      t = j / n
+      stamp(int(x0 + t * (x1 - x0)), int(y0 + t * (y1 - y0)), r, color)
+  d = turtle.dots
+  for k in range(0, len(turtle.dot_colors)):
+    color = bytes(round(255 * c) for c in rgb(turtle.dot_colors[k]))
+    cx = d[3*k] - xmin; cy = ymax - d[3*k+1]; radius = d[3*k+2] / 2
+    for y in range(max(int(cy - radius), 0), min(int(cy + radius) + 1, H)):
+      for x in range(max(int(cx - radius), 0), min(int(cx + radius) + 1, W)):
+        if (x - cx)**2 + (y - cy)**2 <= radius**2:
+          pixels[3*(W*y + x) : 3*(W*y + x) + 3] = color
+
+  rows = b''.join(b'\x00' + bytes(pixels[3*W*y : 3*W*(y+1)]) for y in range(0, H))
+
+  def chunk(kind, data):
+    return (struct.pack(">I", len(data)) + kind + data
+            + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+  with open(filename, 'wb') as file:
+    file.write(b'\x89PNG\r\n\x1a\n')
+    file.write(chunk(b'IHDR', struct.pack(">IIBBBBB", W, H, 8, 2, 0, 0, 0)))
+    file.write(chunk(b'IDAT', zlib.compress(rows, 6)))
+    file.write(chunk(b'IEND', b''))
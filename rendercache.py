@@ -0,0 +1,215 @@
+# file: rendercache.py
+"""
+rendercache.py: keep the images drawn by the figure functions on disk,
+so that a figure drawn before is not drawn again.
+
+Usage:
+
+  % python3 rendercache.py star n=5 depth=6 -o star.png
+  % python3 rendercache.py nautilus A=12 k=0.95 -o nautilus.svg --cache /tmp/renders
+  % python3 rendercache.py --info
+
+The first draws the star of sweep.FIGURES with 5 rays and depth 6 and
+saves it in star.png -- or, if it was drawn before, copies it from the
+cache.  The cache is in ~/.cache/pyexamples-render by default, holds at
+most --max-mb megabytes and prints its statistics after each request.
+
+An image is stored under a key, the SHA-256 of
+
+  the figure function's module, name and source text, and the text of
+  the modules of this repository it uses by name (e.g. geometry for
+  draw_star), and of recorder.py, which writes the image;
+  the parameters, defaults included, and the format;
+
+so that a change to the drawing code or to any parameter gives a new
+key.  Files are written to a temporary name and renamed into place, so
+processes sharing a cache (sweep.py --cache, an image service) never
+see half a file.  A file's modification time is set when it is used.
+
+A RenderCache keeps the size of the cache as it found it on its last
+scan of the directory, plus what it has written since; only when that
+passes max_bytes does it scan again and remove the least recently used
+files, down to EVICT_TO of max_bytes.  So the directory is not scanned
+on every write, and with several processes writing, the cache can go
+over max_bytes by what the others wrote since the last scan.
+
+The hits and misses of a RenderCache are those of its own requests, in
+its own process; sweep.py adds up those of its workers.
+"""
+import sys, os, json, hashlib, inspect, shutil, argparse
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'pyexamples-render')
+MAX_BYTES = 1 << 30
+EVICT_TO = 0.8
+
+code_digests = { }
+
+def code_digest(function):
+  """Return a digest of the code which draws with function: its source
+  and the source files of the modules next to it which it names."""
+  if function in code_digests:
+    return code_digests[function]
+  h = hashlib.sha256()
+  try:
+    h.update(inspect.getsource(function).encode())
+  except (OSError, TypeError):
+    h.update(function.__code__.co_code)
+  here = os.path.dirname(os.path.abspath(inspect.getfile(function)))
+  for name in sorted(set(function.__code__.co_names) | {'recorder'}):
+    path = os.path.join(here, name + '.py')
+    if os.path.exists(path):
+      with open(path, 'rb') as file:
+        h.update(name.encode() + b'\0' + file.read())
+  code_digests[function] = h.hexdigest()
+  return code_digests[function]
+
+def render_key(function, params, format):
+  """Return the cache key of the image drawn by function(turtle, **params)
+  in format; see above."""
+  text = json.dumps([function.__module__, function.__qualname__, code_digest(function),
+                     sorted(params.items()), format])
+  return hashlib.sha256(text.encode()).hexdigest()
+
+class RenderCache:
+  """Images on disk in directory, keyed by render_key, holding at most
+  max_bytes (least recently used first out)."""
+
+  def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=MAX_BYTES):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+    self.size = None      # bytes in the cache, as far as we know; None: not scanned
+    os.makedirs(directory, exist_ok=True)
+
+  def path(self, key, format):
+    return os.path.join(self.directory, key[:2], key + '.' + format)
+
+  def get(self, key, format):
+    """Return the file for key, or None if it is not in the cache."""
+    path = self.path(key, format)
+    try:
+      os.utime(path)
+    except FileNotFoundError:
+      self.misses = self.misses + 1
+      return None
+    self.hits = self.hits + 1
+    return path
+
+  def put(self, key, format, write):
+    """Store the file written by write(name) under key; return its path."""
+    path = self.path(key, format)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = "%s.%d.tmp" % (path, os.getpid())
+    try:
+      write(temp)
+      size = os.path.getsize(temp)
+      os.replace(temp, path)
+    finally:
+      if os.path.exists(temp):
+        os.remove(temp)
+    if self.size is None or self.size + size > self.max_bytes:
+      self.evict(keep=path)
+    else:
+      self.size = self.size + size
+    return path
+
+  def render(self, function, params, format):
+    """Return (path, hit): the image drawn by function(turtle, **params) in
+    format, from the cache (hit) or drawn with a RecordingTurtle now."""
+    key = render_key(function, params, format)
+    path = self.get(key, format)
+    if path is not None:
+      return path, True
+
+    def write(name):
+      from recorder import RecordingTurtle
+      turtle = RecordingTurtle()
+      function(turtle, **params)
+      turtle.save(name, format)
+
+    return self.put(key, format, write), False
+
+  def fetch(self, function, params, format, output):
+    """Copy the image drawn by function(turtle, **params) in format to the
+    file output, through the cache; return True if it was there.  If
+    another process evicts it before it is copied, it is drawn again;
+    if output can't be written (no such directory), that error is raised."""
+    while True:
+      path, hit = self.render(function, params, format)
+      try:
+        shutil.copyfile(path, output)
+        return hit
+      except FileNotFoundError:
+        if os.path.exists(path):
+          raise
+
+  def files(self):
+    """Yield (modification time, size, path) of each image in the cache."""
+    for entry in os.scandir(self.directory):
+      if not entry.is_dir():
+        continue
+      for file in os.scandir(entry.path):
+        if file.name.endswith('.tmp'):
+          continue
+        try:
+          info = file.stat()
+        except FileNotFoundError:
+          continue
+        yield info.st_mtime, info.st_size, file.path
+
+  def evict(self, keep=None):
+    """Scan the cache, and if it holds more than max_bytes remove the
+    least recently used images, but not keep, down to EVICT_TO of it."""
+    files = sorted(self.files())
+    total = sum(size for (mtime, size, path) in files)
+    limit = self.max_bytes if total <= self.max_bytes else EVICT_TO * self.max_bytes
+    for mtime, size, path in files:
+      if total <= limit:
+        break
+      if path == keep:
+        continue
+      try:
+        os.remove(path)
+      except FileNotFoundError:
+        pass
+      total = total - size
+    self.size = total
+
+  def info(self):
+    """Return (hits, misses, images, bytes, max_bytes)."""
+    files = list(self.files())
+    return (self.hits, self.misses, len(files), sum(f[1] for f in files), self.max_bytes)
+
+def main(argv):
+  import sweep
+  parser = argparse.ArgumentParser(description="Draw a figure, or take it from the render cache")
+  parser.add_argument("figure", nargs="?", choices=sorted(sweep.FIGURES))
+  parser.add_argument("params", nargs="*", metavar="NAME=VALUE")
+  parser.add_argument("-o", "--output", default=None, help="image file (default FIGURE.png)")
+  parser.add_argument("--cache", default=DEFAULT_DIRECTORY, help="cache directory")
+  parser.add_argument("--max-mb", type=float, default=MAX_BYTES / 1e6, help="size of the cache")
+  parser.add_argument("--info", action="store_true", help="only print the statistics of the cache")
+  args = parser.parse_args(argv)
+  cache = RenderCache(args.cache, int(args.max_mb * 1e6))
+  if args.figure and not args.info:
+    function, params = sweep.FIGURES[args.figure]
+    params = dict(params)
+    names = list(inspect.signature(function).parameters)[1:]
+    for param in args.params:
+      name, _, value = param.partition('=')
+      if name not in names:
+        parser.error("%s has parameters %s, not %s" % (args.figure, ', '.join(names), name))
+      try:
+        params[name] = sweep.integer_values(args.figure, name, sweep.parse_values(value))[0]
+      except ValueError as e:
+        parser.error(str(e))
+    output = args.output or args.figure + '.png'
+    hit = cache.fetch(function, params, output.rsplit('.', 1)[-1].lower(), output)
+    print("%s: %s" % (output, "from the cache" if hit else "drawn"))
+  hits, misses, images, size, max_bytes = cache.info()
+  print("cache %s: %d images, %.1f of %.1f MB; %d hits, %d misses" %
+        (cache.directory, images, size / 1e6, max_bytes / 1e6, hits, misses))
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
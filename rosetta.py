@@ -3,9 +3,7 @@
 """Draw rosetta figure using pentagons."""
 # Author: J. Carlson, 2/14/2013 @ square-the-circle.com
 
-from turtle import *
-fred = Turtle()
-fred.speed("fast")
+from utilities import saveImage, new_turtle
 
 def pentagon(turtle):
   for k in range(0,5):
@@ -19,15 +17,12 @@ def repeat(figure, turtle, n, angle):
   turtle.penup()
   turtle.forward(1000)
     
-def saveImage(turtle, filename):
-  ts = turtle.getscreen()
-  tc = ts.getcanvas()
-  tc.postscript(file=filename)
-   
 def run(filename):
+  fred = new_turtle()
+  fred.speed("fast")
   repeat(pentagon, fred, 20, 360/20)
   saveImage(fred, filename)
-  exitonclick()
+  fred.getscreen().exitonclick()
    
 if __name__ == "__main__": 
   run("rosetta5-20.eps")
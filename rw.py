@@ -4,8 +4,8 @@
 for each walk. Execute with 'python3 rw.py'"""
 
 
-from turtle import *
 from random import randint, uniform
+from utilities import saveImage, new_turtle, draw_segments
 
 
 def random_move(turtle, distance):
@@ -33,23 +33,26 @@ def random_walk(turtle, distance, steps):
   gohome(turtle)
 
 def repeat(steps, trials):
-  """Repeat random_walk."""
-  for trial in range(0,trials):
-    random_walk(fred, 5, steps)
-
-def saveImage(turtle, filename):
-  """Save drawing to eps file."""
-  ts = turtle.getscreen()
-  tc = ts.getcanvas()
-  tc.postscript(file=filename)
-  
-fred = Turtle()
+  """Repeat random_walk.  The walks are simulated all at once by 
+  walks.walk_positions, then drawn; without NumPy, step by step."""
+  try:
+    from walks import walk_positions, walk_segments
+    paths = walk_positions(trials, steps, 5)
+  except ImportError:
+    for trial in range(0,trials):
+      random_walk(fred, 5, steps)
+    return
+  for path in paths:
+    fred.color(randcolor(), randcolor())
+    draw_segments(fred, walk_segments(path))
+
+fred = new_turtle()
 fred.speed("fastest")
-colormode(255)
+fred.getscreen().colormode(255)
 N = 2000
 
 fred.dot(10, "black")
 repeat(2000, 20)
 
 saveImage(fred, "fred1234.eps")
-exitonclick()
+fred.getscreen().exitonclick()
@@ -7,8 +7,7 @@ Usage:
 """
 
 from random import randint
-from utilities import saveImage
-from turtle import *
+from utilities import saveImage, new_turtle, draw_segments
 
 def rm(turtle, d):
   """random move (up, down, left, right) for turtle 
@@ -21,20 +20,28 @@ def rm(turtle, d):
   turtle.forward(d)
 
 def run(d, n):
-  """run turtle."""
-  fred = Turtle()
+  """run turtle: a walk of n steps of d pixels, simulated by
+  walks.walk_positions (step by step without NumPy)."""
+  fred = new_turtle()
   fred.speed("fastest")
 
-  for k in range(0, n):
-    rm(fred, d)
-    # print(k)
+  try:
+    from walks import walk_positions, walk_segments
+    path = walk_positions(1, n, d, grid=True)[0]
+  except ImportError:
+    for k in range(0, n):
+      rm(fred, d)
+      # print(k)
+  else:
+    draw_segments(fred, walk_segments(path))
 
   fred.hideturtle()
   saveImage(fred, "random_walk.eps")
+  return fred
 
 
 if __name__ == '__main__':
-    run(10,2000)
+    fred = run(10,2000)
     
-    exitonclick()
+    fred.getscreen().exitonclick()
 
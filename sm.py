@@ -84,13 +84,56 @@ INTERACTIVE MODE:
   >>> run("defprog cube dup dup mul mul /defprog 3 cube")
   27
   
+  # compiled programs inline definitions and fold constants:
+  # 9 instructions come down to no operations at all
+  >>> optimize_report(compile_code("3 cube 2 div dup pop".split()))
+  (9, 0)
+  
+  # numbers whose repr is not Python, like inf, stay numbers once
+  # their run has been compiled
+  >>> [run("1.0e999 1.0 add") for k in range(4)]
+  [inf, inf, inf, inf]
+  >>> [run("1.0e308 10.0 mul 1.0 add") for k in range(4)]
+  [inf, inf, inf, inf]
+  >>> [run("9999999999" + " dup mul" * 10).bit_length() for k in range(4)]
+  [34017, 34017, 34017, 34017]
+  
+  # programs are compiled once and cached by source text; a cached
+  # program still sees later changes to the op table
+  >>> clear_cache()
+  >>> run("5 x sto")
+  >>> run("x rcl")
+  5
+  >>> run("6 x sto")
+  >>> run("x rcl")
+  6
+  >>> cache_info()
+  (1, 3, 3, 256)
+  
+  # a StackMachine has its own variables and definitions
+  >>> m = StackMachine()
+  >>> m.run("4 a sto a rcl")
+  4
+  >>> run("a rcl")
+  3
+  
+  # run_batch returns each program's value, or the error it raised
+  >>> run_batch(['1 2 add', 'b rcl', '2 3 mul'], 2, threads=True)
+  [3, KeyError('b'), 6]
+  
   To add new instructions, add entries to the dictionary 'opTable',
   then add the corresponding function.  See, for example, how the 
   functions 'add' (binary), 'int' (unary), and 'pi' (0-ary) are 
-  implemented. 
+  implemented.  An instruction which reads or writes the op table, 
+  like 'sto', is a 'table' entry, and its function is given the table 
+  too.  StackMachines made afterwards have the new instructions.
 """
 
-import sys
+import sys, time
+from collections import OrderedDict
+
+# json, multiprocessing, threading, asyncio and doctest are imported
+# where they are used, so that 'python3 sm.py 1 2 add' starts quickly.
 
 """
 Contents:
@@ -107,6 +150,8 @@ message = """
   COMMAND LINE:
   python3 sm.py 1 2 add       -- simple example, command line
   python3 sm.py -s 1 2 add    -- same, silent (verbose = off)
+  python3 sm.py -p 1 2 add    -- same, profiled: print counts and times
+  python3 sm.py -S path       -- serve programs on a Unix socket ('-': stdin)
   python3 sm.py -t            -- internal test
   python3 sm.py -d            -- print documentation
 
@@ -116,6 +161,9 @@ message = """
   >>> verbose_off()          -- verbose_on() sets verbosity to default value
   >>> run('1 2 add')         -- example, interactive mode
   >>> ex(['1', '2', 'add'])  -- same example, list input
+  >>> StackMachine().run('1 2 add')   -- same, on a machine of its own
+  >>> run_batch(['1 2 add', '2 3 mul'])  -- run many programs in parallel
+  >>> profile('1 2 add')[1].report()     -- instruction counts and times
   
   Use 'verbose_on() to see stack trace
 
@@ -152,7 +200,11 @@ def div(stack):
   
 def INT(stack):
   """Pop top values of stack, take integer part, push result onto stack."""
-  stack.append(int(stack.pop()))
+  x = stack.pop()
+  if hasattr(x, 'astype'):
+    stack.append(x.astype(int))   # a column: see run_columns
+  else:
+    stack.append(int(x))
   
 def pi(stack):
   """Push value of pi onto stack."""
@@ -162,19 +214,24 @@ def dup(stack):
   """Put copy of top value of stack onto stack."""
   stack.append(top(stack))
   
-def sto(stack):
-  """Pop stack[top], stack[top-1].  Install stack[top-1] in opTable,
-  set value to ('var', stack[top]).
+def sto(stack, table=None):
+  """Pop stack[top], stack[top-1].  Install stack[top-1] in the op table
+  (opTable if none is given), set value to ('var', stack[top]).
   # STACK: 7 A sto <top>"""
+  if table is None:
+    table = opTable
   var = stack.pop()
   val = ('var', stack.pop())
-  opTable[var] = val
+  table[var] = val
   
-def rcl(stack):
-  """Pop top of stack, let op be the result.  Push opTable[op][1] onto stack."""
+def rcl(stack, table=None):
+  """Pop top of stack, let op be the result.  Push table[op][1] onto stack
+  (table is opTable if none is given)."""
   # STACK: A <top> ==> STACK: 7 <top>
+  if table is None:
+    table = opTable
   op = stack.pop()
-  opVal = opTable[op]
+  opVal = table[op]
   stack.append(opVal[1])
     
 def report(stack):
@@ -185,15 +242,20 @@ def popstack(stack):
   """Pop stack."""
   stack.pop()
   
-def show_opTable(stack):
-  """print operator table."""
-  for key in opTable:
-    print(key, opTable[key])
+def show_opTable(stack, table=None):
+  """print operator table (opTable if none is given)."""
+  if table is None:
+    table = opTable
+  for key in table:
+    print(key, table[key])
     
-def clear_op(stack):
-  """Pop name from stack and clear it from the operator table."""
+def clear_op(stack, table=None):
+  """Pop name from stack and clear it from the operator table (opTable 
+  if none is given)."""
+  if table is None:
+    table = opTable
   key = stack.pop()
-  opTable.pop(key, None)
+  table.pop(key, None)
 
 def clear_stack(stack):
   """Clear the stack."""
@@ -202,17 +264,32 @@ def clear_stack(stack):
 # DICTIONAY WHICH DEFINES THE INSTRUCTION SET.  KEYS ARE INSTRUCTIONS (STRINGS).
 # VALUES ARE PAIRS: A TUPLE WHOSE FIRST ELEMENT GIVES THE INSTRUCTION TYPE
 # AND WHOSE SECOND ELEMENT IS A FUNCTION.
-opTable = {'sto':('stack', sto), 'rcl':('stack', rcl), 'dup': ('stack', dup),
-        'report':('stack', report), 'pop':('stack', popstack), 'clear_op':('stack', clear_op),
-        'show_opTable':('stack', show_opTable), 'clear_stack':('stack', clear_stack),
+opTable = {'sto':('table', sto), 'rcl':('table', rcl), 'dup': ('stack', dup),
+        'report':('stack', report), 'pop':('stack', popstack), 'clear_op':('table', clear_op),
+        'show_opTable':('table', show_opTable), 'clear_stack':('stack', clear_stack),
        'add': ('stack', add), 'sub': ('stack', sub), 'mul': ('stack', mul), 'div': ('stack',div),
         'int': ('stack', INT), 'pi':('stack', pi), 'double':('code', [2, 'mul']),
          'square':('prog', ('dup', 'mul')) }
 
+# THE INSTRUCTION SET AS BUILT IN, BEFORE ANY PROGRAM HAS CHANGED opTable.
+builtinTable = dict(opTable)
+
+def instruction_set():
+  """Return a new op table for a machine: the builtin instruction set, 
+  with the 'stack' and 'table' instructions of opTable as it is now, so 
+  that instructions added to opTable after import are included (but not 
+  the variables and definitions of programs)."""
+  table = dict(builtinTable)
+  for name in opTable:
+    if opTable[name][0] in ('stack', 'table'):
+      table[name] = opTable[name]
+  return table
+
 """
 Operator types:
 
 stack: operates on the full stack
+table: operates on the full stack and the op table
 code: can be pushed onto the stack and then executed
 prog: must be run through the interpreter one token at a time
 
@@ -232,15 +309,25 @@ def top(stack):
   else:
     return "NONONO!"
     
-def is_executable(op):
-  if op not in opTable:
+def is_executable(op, table=None):
+  table, flag = settings(table, None)
+  if op not in table:
     return False
-  opType, opValue = opTable[op]
+  opType, opValue = table[op]
   if opType == 'var':
     return False
   else:
     return True
 
+def settings(table, flag):
+  """Return the op table and verbosity to use: those given, 
+  or else the global ones."""
+  if table is None:
+    table = opTable
+  if flag is None:
+    flag = verbose
+  return table, flag
+
 def evaluate(x):
   if x[0].isalpha():
     return x
@@ -254,64 +341,69 @@ def pushvector(v, stack):
   for element in v:
     stack.append(element)
     
-def exprog(prog, stack):
+def exprog(prog, stack, table, verbose, profiler=None):
   """Execute the program 'prog'."""
-  global verbose
-  
   stack.pop()
   i = 0
   while i < len(prog):
     op = prog[i]
     stack.append(op)
-    vprint(verbose, "prog:", prog[i:])
-    exop(stack)
+    if verbose:
+      vprint(verbose, "prog:", prog[i:])
+    exop(stack, table, verbose, profiler)
     i = i + 1
 
-def exstackop(operator, stack):
+def exstackop(operator, stack, table, verbose, profiler=None):
   stack.pop()
   operator(stack)
 
-def excode(operator, stack):
+def extableop(operator, stack, table, verbose, profiler=None):
+  stack.pop()
+  operator(stack, table)
+
+def excode(operator, stack, table, verbose, profiler=None):
   stack.pop()
   pushvector(operator, stack)
 
-def ex_nothing(operator, stack):
+def ex_nothing(operator, stack, table, verbose, profiler=None):
   pass
 
 ex_table = { }
 ex_table['var'] = ex_nothing
 ex_table['code'] = excode
 ex_table['stack']= exstackop
+ex_table['table'] = extableop
 ex_table['prog'] = exprog
 
-def exop(stack):
+def exop(stack, table=None, verbose=None, profiler=None):
   """Execute the operator which is at the top of the stack.
   Find the type of the operator, then dispatch """
-  global verbose
+  table, verbose = settings(table, verbose)
   vprint(verbose, "in exop, stack:", stack)
   
   op = top(stack)
-  operatorType, operator = opTable[op]
+  operatorType, operator = table[op]
   f = ex_table[operatorType]
-  f(operator, stack)
+  if profiler is None:
+    f(operator, stack, table, verbose)
+  else:
+    profiler.call(op, f, operator, stack, table, verbose)
   
-def excodedef(code, i):
-  global verbose
-  global opTable
+def excodedef(code, i, table=None, verbose=None):
+  table, verbose = settings(table, verbose)
   
   op = code[i+1]
   currentcode = code[i+1:]
   def_end = code.index('/defcode')  # BUG HERE!!
   codebody = list(map(evaluate, code[i+2:def_end]))
   i = def_end  # ADVANCE TO FIRST TOKEN BEYOND THE DEFINITION
-  opTable[op] = ('code', codebody)
+  table[op] = ('code', codebody)
   vprint(verbose, "new op:", op)
-  vprint(verbose, "codebody:", opTable[op])
+  vprint(verbose, "codebody:", table[op])
   return i,def_end
 
-def exprogdef(code, i):
-  global verbose  
-  global opTable
+def exprogdef(code, i, table=None, verbose=None):
+  table, verbose = settings(table, verbose)
   
   op = code[i+1]
   currentcode = code[i+1:]
@@ -323,23 +415,25 @@ def exprogdef(code, i):
   vprint(verbose, "defcode, codebody:", codebody)
   vprint(verbose, "remaining code", code[i:])
   
-  opTable[op] = ('prog', codebody)
+  table[op] = ('prog', codebody)
   
   vprint(verbose, "new op:", op)
-  vprint(verbose, "codebody:", opTable[op])
+  vprint(verbose, "codebody:", table[op])
   
   return i,def_end
           
-def ex(code):
-  """ex(code):  execute a list or tuple of strings representing instructions and data.
-  Example: ex(['1', '2', 'add']) or ex(('1', '2', 'add'))."""
-  global verbose
-  global opTable
+def interpret(code, table=None, verbose=None, S=None, profiler=None):
+  """interpret(code): execute a list or tuple of strings representing instructions
+  and data one token at a time, printing a trace if verbose is on, and 
+  recording each instruction in profiler if one is given (see Profiler).
+  Example: interpret(['1', '2', 'add'])."""
+  table, verbose = settings(table, verbose)
   vprint(verbose, "=================================", "")
   vprint(verbose, "code:", code)
   
   # SET UP STACK AND CODE POINTERS ip, def_end
-  S = []
+  if S is None:
+    S = []
   ip = 0; def_end = 0
   
   # MAIN LOOP
@@ -354,16 +448,18 @@ def ex(code):
     # PROCESS TOKEN: 
 
     if token == 'defcode':
-      ip,def_end = excodedef(code,ip)
+      ip,def_end = excodedef(code,ip,table,verbose)
     elif token == 'defprog':
-      ip,def_end = exprogdef(code,ip)
+      ip,def_end = exprogdef(code,ip,table,verbose)
     else:
       S.append(evaluate(token))
      
     # EXECUTE STACK
-    while is_executable(top(S)) & (top(S) != 'halt'):
-      exop(S)
+    while is_executable(top(S), table) & (top(S) != 'halt'):
+      exop(S, table, verbose, profiler)
     vprint(verbose, "stack:", S) 
+    if profiler is not None:
+      profiler.token(S)
     
     # ADVANCE TOKEN CURSOR AND ENSURE THAT 
     # IT IS TO THE RIGHT OF THE LAST DEFINITION PROCESSED
@@ -378,13 +474,822 @@ def ex(code):
     return S.pop() 
   else:
     return None  
-	
-	
+
+##########################################################
+# PROFILER
+##########################################################
+
+"""
+profile(input) runs the input through the interpreter with a Profiler, 
+which records for every instruction executed -- builtin, or defined 
+with defcode, defprog or sto -- how often it ran and the time spent in 
+it, including the instructions it ran in turn.  It also records the 
+deepest the stack got and the number of instructions per second.
+report() returns all this as a dictionary (ready for json.dump), and 
+folded() the time spent in each chain of instructions in the 'folded 
+stacks' format read by flame graph tools (flamegraph.pl, speedscope):
+
+  run;cube;mul 12
+
+-- 12 microseconds spent in mul, run by cube, itself not in another
+instruction.  Without a profiler the interpreter only checks that it 
+has none; compiled programs (execute) are never profiled.
+"""
+
+class Profiler:
+  """Profiler(): counts and times of the instructions run by interpret."""
+
+  def __init__(self):
+    self.counts = { }       # instruction -> times run
+    self.seconds = { }      # instruction -> time spent, inclusive
+    self.types = { }        # instruction -> operator type
+    self.stacks = { }       # chain of instructions -> time spent, exclusive
+    self.path = ['run']
+    self.inner = [0.0]      # time spent in the instructions run by each of path
+    self.tokens = 0
+    self.instructions = 0
+    self.max_depth = 0
+    self.elapsed = 0.0
+
+  def call(self, op, f, operator, stack, table, verbose):
+    """Run the handler f for the instruction op, as exop does, timing it."""
+    self.instructions = self.instructions + 1
+    self.types[op] = table[op][0]
+    self.path.append(op)
+    self.inner.append(0.0)
+    start = time.perf_counter()
+    try:
+      f(operator, stack, table, verbose, self)
+    finally:
+      seconds = time.perf_counter() - start
+      inner = self.inner.pop()
+      key = ";".join(self.path)
+      self.path.pop()
+      self.inner[-1] = self.inner[-1] + seconds
+      self.counts[op] = self.counts.get(op, 0) + 1
+      # A recursive instruction is only timed at its outermost call.
+      if op not in self.path:
+        self.seconds[op] = self.seconds.get(op, 0.0) + seconds
+      self.stacks[key] = self.stacks.get(key, 0.0) + seconds - inner
+      if len(stack) > self.max_depth:
+        self.max_depth = len(stack)
+
+  def token(self, stack):
+    """Note that interpret has processed a token."""
+    self.tokens = self.tokens + 1
+    if len(stack) > self.max_depth:
+      self.max_depth = len(stack)
+
+  def report(self):
+    """Return the counts and times as a dictionary."""
+    rate = self.instructions / self.elapsed if self.elapsed > 0 else 0.0
+    ops = { }
+    for op in self.counts:
+      ops[op] = {'type': self.types[op], 'count': self.counts[op], 
+                 'seconds': self.seconds.get(op, 0.0)}
+    return {'tokens': self.tokens, 'instructions': self.instructions,
+            'seconds': self.elapsed, 'instructions_per_second': rate,
+            'max_stack_depth': self.max_depth, 'ops': ops}
+
+  def folded(self):
+    """Return the time spent in each chain of instructions, in
+    microseconds, as lines in the folded stacks format."""
+    lines = [ ]
+    for key in sorted(self.stacks):
+      lines.append("%s %d" % (key, round(self.stacks[key] * 1e6)))
+    return "\n".join(lines)
+
+def profile(input, table=None, S=None):
+  """profile(input): run the input string through the interpreter (without 
+  trace) and return (value, profiler), profiler holding the counts and times.
+  Example: profile('3 cube 2 mul')[1].report()"""
+  profiler = Profiler()
+  start = time.perf_counter()
+  try:
+    value = interpret(input.split(" "), table, False, S, profiler)
+  finally:
+    profiler.elapsed = time.perf_counter() - start
+  return value, profiler
+
+##########################################################
+# COMPILER
+##########################################################
+
+"""
+compile_code(code) turns a list of tokens into a program for the
+dispatch loop in execute(program).  A program is a triple
+
+  (ops, args, consts)
+
+where ops[k] is an integer opcode and consts[args[k]] its operand.
+Tokens are parsed (evaluate) once, at compile time, and the token 
+cursor of 'interpret' -- including its jumps over definitions -- is 
+worked out in advance, so execute only has to follow the opcodes.
+The op table is still consulted at run time, so 'sto', 'clear_op', 
+'defcode' and 'defprog' behave exactly as in the interpreter.
+
+Runs of numbers and pure arithmetic instructions (see pureTable) are 
+also compiled into a single Python function, a BLOCK.  A BLOCK checks 
+that its instructions still have their builtin meaning and that the 
+values it takes from the stack are numbers; if not, execute falls 
+back to the instructions of the run, which follow the BLOCK.  Since 
+building a BLOCK costs more than running its instructions once, it 
+is only built when execute reaches it for the HOT-th time.
+
+A BLOCK is optimized as it is built:
+
+  - 'code' and 'prog' operators whose bodies come down to numbers and 
+    pure instructions are inlined, as they are defined in the op table 
+    when the BLOCK is built, nested definitions included (see expansion); 
+    the BLOCK checks that their entries are still the ones inlined.  It 
+    stops at the first value of the run which can't be inlined
+  - operations on constants are done once, at build time: '2 3 add' 
+    becomes 5
+  - 'dup' and 'pop' only move values on the simulated stack, so a 
+    'dup' followed by 'pop' leaves no code at all
+
+optimize_report(program) tells how many instructions were removed.
+"""
+
+PUSH, DEFCODE, DEFPROG, JUMP, FAIL, BLOCK = range(6)
+
+HOT = 2
+
+# Instructions which only compute with numbers on the stack.
+# Values: the op table entry they must have, and the Python code 
+# of the instruction (a and b are the top and second values).
+pureTable = {'add': (builtinTable['add'], 2, "{a} + {b}"), 'mul': (builtinTable['mul'], 2, "{a} * {b}"),
+             'sub': (builtinTable['sub'], 2, "{b} - {a}"), 'div': (builtinTable['div'], 2, "{b} / {a}"),
+             'int': (builtinTable['int'], 1, "int({a})"), 'pi': (builtinTable['pi'], 0, "3.131459265"),
+             'dup': (builtinTable['dup'], 1, None), 'pop': (builtinTable['pop'], 1, None)}
+
+NUMBERS = (int, float)
+
+def expansion(name, table, guards, prog=False, seen=()):
+  """Return the numbers and pure instructions which running the 
+  instruction name comes down to, given the op table, or None if
+  it can't be inlined.  If it can, the entries it depends on are 
+  added to guards.  With prog True, name is run as part of a 'prog' 
+  body, one exop and no more."""
+  entry = table.get(name)
+  if entry is None or name in seen:
+    return None
+  found = { }
+  values = inlined(name, entry, table, found, prog, seen)
+  if values is not None:
+    guards.update(found)
+    guards[name] = entry
+  return values
+
+def inlined(name, entry, table, guards, prog, seen):
+  """The body of expansion: inline name, whose op table entry is entry."""
+  if name in pureTable:
+    return [name] if entry == pureTable[name][0] else None
+  operatorType, body = entry
+  seen = seen + (name,)
+  values = [ ]
+  if operatorType == 'code' and not prog:
+    # The body is pushed and only its last value is executed.
+    for value in body[:-1]:
+      if type(value) not in NUMBERS:
+        return None
+      values.append(value)
+    if len(body) > 0:
+      last = body[-1]
+      if type(last) in NUMBERS:
+        values.append(last)
+      elif type(last) != str:
+        return None
+      else:
+        inner = expansion(last, table, guards, False, seen)
+        if inner is None:
+          return None
+        values = values + inner
+    return values
+  if operatorType == 'prog':
+    # Each instruction of the body is executed once.
+    for op in body:
+      inner = expansion(op, table, guards, True, seen) if type(op) == str else None
+      if inner is None:
+        return None
+      values = values + inner
+    return values
+  return None
+
+def build_block(x, table):
+  """Build the BLOCK x (see compile_code) as defined in table.  Its
+  function is stored last: a thread sharing the program may run the
+  BLOCK as soon as it is there, and must find its length with it."""
+  function, x[1], x[4], x[5] = compile_block(x[2], table)
+  x[0] = function
+
+def never(S, T):
+  """The BLOCK of a run which could not be compiled."""
+  return False
+
+def compile_block(values, table):
+  """Return (function, length, instructions, operations) for a run of numbers 
+  and instructions, inlining them as they are defined in table.  The function 
+  covers the first length values of the run, as far as they can be inlined; 
+  it takes the stack and the op table and returns True if it ran, False if 
+  they must be executed instruction by instruction.  Instructions counts 
+  the numbers and pure instructions they come down to, operations those 
+  left in the function."""
+  guards = { }      # op table entries the run depends on
+  primitives = [ ]  # the run, inlined
+  length = 0
+  for value in values:
+    if type(value) == str:
+      inner = expansion(value, table, guards)
+      if inner is None:
+        break
+      primitives = primitives + inner
+    else:
+      primitives.append(value)
+    length = length + 1
+  if length < 2:
+    return never, 0, 0, 0
+
+  lines = [ ]
+  sim = [ ]         # simulated stack: constants and names of Python variables
+  inputs = [ ]      # values taken from the stack, top first
+  exposed = [ ]     # depths at which 'pop' left a stack value on top
+  count = 0
+
+  def operand():
+    # Pop the simulated stack; when it is empty, take the next value
+    # from the real stack.
+    if len(sim) == 0:
+      name = "x%d" % len(inputs)
+      inputs.append(name)
+      sim.append(name)
+    return sim.pop()
+
+  constants = [ ]   # values of the numbers, passed to the function as C
+
+  def text(a):
+    # A number goes in C rather than in the source: the repr of some
+    # (inf, nan, ints too long to print) is not Python.
+    if type(a) == str:
+      return a
+    constants.append(a)
+    return "C[%d]" % (len(constants) - 1)
+
+  for value in primitives:
+    if type(value) != str:
+      sim.append(value)
+      continue
+    entry, arity, expression = pureTable[value]
+    if value == 'dup':
+      a = operand()
+      sim.append(a)
+      sim.append(a)
+      continue
+    if value == 'pop':
+      operand()
+      if len(sim) == 0:
+        exposed.append(len(inputs))
+      continue
+    operands = [operand() for k in range(0, arity)]
+    if all(type(a) != str for a in operands):
+      # Constants: run the instruction itself now.
+      stack = operands[::-1]
+      try:
+        entry[1](stack)
+        sim.append(stack[-1])
+        continue
+      except Exception:
+        pass
+    a = text(operands[0]) if arity > 0 else None
+    b = text(operands[1]) if arity > 1 else None
+    count = count + 1
+    v = "v%d" % count
+    lines.append("%s = %s" % (v, expression.format(a=a, b=b)))
+    sim.append(v)
+
+  # A value left on top by 'pop' could be an instruction or 'halt',
+  # so it must be a number too.  Only the one just below the inputs
+  # has not been checked already.
+  K = len(inputs)
+  checked = K + 1 if K in exposed else K
+  names = list(guards)
+  source = ["def block(S, T):"]
+  if checked > 0:
+    source.append("  if len(S) < %d: return False" % checked)
+  for k in range(0, len(names)):
+    # Only 'code', 'prog' and instruction entries are guarded, never a
+    # variable, so comparing them can't touch a column (run_columns).
+    # An entry defined again with the same body is equal, not the same.
+    source.append("  e = T.get(%r)" % names[k])
+    source.append("  if e is not E[%d] and e != E[%d]: return False" % (k, k))
+  for k in range(0, K):
+    source.append("  %s = S[%d]" % (inputs[k], -k-1))
+    source.append("  if type(%s) not in NUMBERS: return False" % inputs[k])
+  if checked > K:
+    source.append("  if type(S[%d]) not in NUMBERS: return False" % (-K-1))
+  if K > 0:
+    source.append("  del S[-%d:]" % K)
+  source = source + ["  " + line for line in lines]
+  if sim:
+    source.append("  S += (%s,)" % ", ".join(text(a) for a in sim))
+  source.append("  return True")
+  namespace = {'NUMBERS': NUMBERS, 'E': [guards[name] for name in names], 'C': constants}
+  exec("\n".join(source), namespace)
+  return namespace['block'], length, len(primitives), count
+
+def compile_code(code):
+  """compile_code(code): compile a list or tuple of tokens into a program for execute.
+  Example: execute(compile_code(['1', '2', 'add']))."""
+
+  # Follow the token cursor of 'interpret'.  (ip, def_end) is its whole
+  # state, so coming back to a state it has been in means a loop.  Only
+  # a definition can move the cursor back, so only those are recorded.
+  steps = [ ]
+  seen = { }
+  ip = 0; def_end = 0
+  n = len(code)
+  while ip < n:
+    token = code[ip]
+    if token == 'defcode' or token == 'defprog':
+      if (ip, def_end) in seen:
+        steps.append((JUMP, seen[(ip, def_end)]))
+        break
+      seen[(ip, def_end)] = len(steps)
+      try:
+        op = code[ip+1]
+        end = code.index('/' + token)
+        body = list(map(evaluate, code[ip+2:end]))
+      except Exception:
+        # A broken definition: let the interpreter raise the error at run time.
+        definer = excodedef if token == 'defcode' else exprogdef
+        steps.append((FAIL, (definer, (code, ip))))
+        break
+      steps.append((DEFCODE if token == 'defcode' else DEFPROG, (op, body)))
+      ip = end; def_end = end
+    else:
+      try:
+        value = evaluate(token)
+      except Exception:
+        steps.append((FAIL, (evaluate, (token,))))
+        break
+      steps.append((PUSH, value))
+    ip = ip + 1
+    if def_end > ip:
+      ip = def_end
+
+  # Lay out the opcodes, putting a BLOCK in front of each run of two
+  # or more pure PUSHes.  A jump target may only start a run.  A name
+  # is pure if it can be inlined, as builtin or as defined so far, or
+  # if it is not defined yet: it may be by the time the BLOCK is built.
+  targets = set(value for (op, value) in steps if op == JUMP)
+  ops = [ ]; args = [ ]; consts = [ ]
+  where = { }     # index in steps -> index in ops
+  run = [ ]       # steps of the current run
+  defs = builtinTable
+  pure = { }      # name -> True if it can be inlined, given defs
+
+  def is_pure(value):
+    if type(value) in NUMBERS:
+      return True
+    if type(value) != str:
+      return False
+    if value not in pure:
+      pure[value] = value not in defs or expansion(value, defs, { }) is not None
+    return pure[value]
+
+  def flush():
+    if len(run) >= 2:
+      where[run[0]] = len(ops)
+      # [function or None, length covered, values, times reached,
+      #  instructions, operations]
+      ops.append(BLOCK); args.append(len(consts))
+      consts.append([None, len(run), [steps[m][1] for m in run], 0, 0, 0])
+    for m in run:
+      where.setdefault(m, len(ops))
+      ops.append(PUSH); args.append(len(consts))
+      consts.append(steps[m][1])
+    del run[:]
+
+  for m in range(0, len(steps)):
+    op, value = steps[m]
+    if m in targets:
+      flush()
+    if op == PUSH and is_pure(value):
+      run.append(m)
+      continue
+    flush()
+    if op == DEFCODE or op == DEFPROG:
+      if defs is builtinTable:
+        defs = dict(builtinTable)
+      defs[value[0]] = ('code' if op == DEFCODE else 'prog', value[1])
+      pure.clear()
+    where[m] = len(ops)
+    ops.append(op); args.append(len(consts))
+    consts.append(value)
+  flush()
+  for pc in range(0, len(ops)):
+    if ops[pc] == JUMP:
+      consts[args[pc]] = where[consts[args[pc]]]
+  return (ops, args, consts)
+
+def settle(S, table):
+  """While the top of the stack is an instruction, execute it.
+  (The inner loop of 'interpret'.)"""
+  while True:
+    op = S[-1] if S else "NONONO!"
+    if type(op) != str:
+      return
+    entry = table.get(op)
+    if entry is None or op == 'halt':
+      return
+    operatorType, operator = entry
+    if operatorType == 'var':
+      return
+    if operatorType == 'stack':
+      S.pop()
+      operator(S)
+    elif operatorType == 'code':
+      S.pop()
+      S.extend(operator)
+    else:
+      ex_table[operatorType](operator, S, table, False)
+
+def execute(program, table=None, S=None):
+  """execute(program): run a program made by compile_code.  Return the
+  value left on top of the stack, just as interpret does."""
+  ops, args, consts = program
+  if table is None:
+    table = opTable
+  if S is None:
+    S = []
+  pc = 0
+  n = len(ops)
+  while pc < n:
+    if S and type(S[-1]) == str and S[-1] == 'halt':
+      break
+    op = ops[pc]
+    x = consts[args[pc]]
+    pc = pc + 1
+    if op == PUSH:
+      S.append(x)
+      if x not in table:
+        continue
+    elif op == BLOCK:
+      if x[0] is None:
+        x[3] = x[3] + 1
+        if x[3] < HOT:
+          continue
+        build_block(x, table)
+      if x[0](S, table):
+        pc = pc + x[1]
+      continue
+    elif op == DEFCODE:
+      table[x[0]] = ('code', list(x[1]))
+    elif op == DEFPROG:
+      table[x[0]] = ('prog', list(x[1]))
+    elif op == JUMP:
+      pc = x
+      continue
+    elif op == FAIL:
+      x[0](*x[1])
+    settle(S, table)
+  if S:
+    return S.pop()
+  return None
+
+def optimize_report(program, table=None):
+  """optimize_report(program): build the BLOCKs of a program made by 
+  compile_code, inlining as defined in table (the op table if None).  
+  Return (instructions, operations): the number of numbers and pure 
+  instructions in them, once inlined, and the number of operations 
+  left after folding constants and removing dup/pop pairs.
+  Example: optimize_report(compile_code('2 3 add x rcl dup pop mul'.split()))"""
+  ops, args, consts = program
+  if table is None:
+    table = opTable
+  instructions = 0; operations = 0
+  for pc in range(0, len(ops)):
+    if ops[pc] == BLOCK:
+      x = consts[args[pc]]
+      if x[0] is None:
+        build_block(x, table)
+      instructions = instructions + x[4]
+      operations = operations + x[5]
+  return instructions, operations
+
+def ex(code):
+  """ex(code):  execute a list or tuple of strings representing instructions and data.
+  Example: ex(['1', '2', 'add']) or ex(('1', '2', 'add')).
+  With verbose on the code is interpreted, with a trace; otherwise 
+  it is compiled and executed."""
+  if verbose:
+    return interpret(code)
+  return execute(compile_code(code))
+
+##########################################################
+# PROGRAM CACHE
+##########################################################
+
+"""
+run(input) keeps the programs made by compile_code in an LRU cache 
+keyed by the input string, so running the same string again skips 
+split, evaluate and the search for definitions.  A program does not 
+depend on the op table -- it is consulted at run time, and a BLOCK 
+checks its instructions before it runs -- so 'sto', 'clear_op', 
+'defcode' and 'defprog' never leave a stale program in the cache.
+"""
+
+class ProgramCache:
+  """An LRU cache of compiled programs, keyed by input string, holding
+  at most size programs (0: no cache)."""
+
+  def __init__(self, size=256):
+    self.programs = OrderedDict()
+    self.size = size
+    self.hits = 0
+    self.misses = 0
+
+  def resize(self, size):
+    self.size = size
+    while len(self.programs) > self.size:
+      self.programs.popitem(last=False)
+
+  def clear(self):
+    self.programs.clear()
+    self.hits = 0
+    self.misses = 0
+
+  def info(self):
+    return (self.hits, self.misses, len(self.programs), self.size)
+
+  def program(self, input):
+    """Return the compiled program for the input string, from the cache
+    if it is there, otherwise compile it and add it to the cache."""
+    program = self.programs.get(input)
+    if program is not None:
+      self.hits = self.hits + 1
+      self.programs.move_to_end(input)
+      return program
+    self.misses = self.misses + 1
+    program = compile_code(input.split(" "))
+    if self.size > 0:
+      self.programs[input] = program
+      if len(self.programs) > self.size:
+        self.programs.popitem(last=False)
+    return program
+
+programCache = ProgramCache()
+
+def set_cache_size(n):
+  """set_cache_size(n): keep at most n programs in the cache (0: no cache)."""
+  programCache.resize(n)
+
+def clear_cache():
+  """clear_cache(): empty the program cache and reset its counters."""
+  programCache.clear()
+
+def cache_info():
+  """cache_info(): return (hits, misses, programs cached, size bound)."""
+  return programCache.info()
+
 def run(input):
   """run(input): parse the input string and run the resulting code.
   Example: run('1 2 add')"""
-  return ex(input.split(" "))
-  	
+  if verbose:
+    return interpret(input.split(" "))
+  return execute(programCache.program(input))
+
+##########################################################
+# MACHINES
+##########################################################
+
+"""
+The functions above share one op table, opTable, and one verbosity 
+flag, so programs run with them see each other's variables and 
+definitions.  A StackMachine has its own op table, stack, verbosity 
+and program cache; machines can run side by side, in threads or 
+processes, without interfering.  (Compiled programs hold no state 
+of a machine, so they could be shared.)
+"""
+
+class StackMachine:
+  """StackMachine(verbose=False, cache_size=256): a stack machine with its 
+  own op table, a copy of the instruction set (see instruction_set).
+  Example: StackMachine().run('3 a sto a rcl square')"""
+
+  def __init__(self, verbose=False, cache_size=256):
+    self.opTable = instruction_set()
+    self.stack = []
+    self.verbose = verbose
+    self.cache = ProgramCache(cache_size)
+
+  def reset(self):
+    """Forget all variables and definitions."""
+    self.opTable = instruction_set()
+    self.stack = []
+
+  def set_verbosity(self, b):
+    self.verbose = b
+
+  def ex(self, code):
+    """Execute a list or tuple of strings, as ex(code)."""
+    self.stack = []
+    if self.verbose:
+      return interpret(code, self.opTable, True, self.stack)
+    return execute(compile_code(code), self.opTable, self.stack)
+
+  def run_columns(self, input, columns):
+    """Run the input string once over columns, as run_columns(input, columns)."""
+    self.stack = []
+    return execute_columns(self.cache.program(input), self.opTable, columns, self.stack)
+
+  def profile(self, input):
+    """Run the input string through the interpreter with a profiler, as 
+    profile(input); return (value, profiler)."""
+    self.stack = []
+    return profile(input, self.opTable, self.stack)
+
+  def run(self, input):
+    """Parse the input string and run the resulting code, as run(input)."""
+    self.stack = []
+    if self.verbose:
+      return interpret(input.split(" "), self.opTable, True, self.stack)
+    return execute(self.cache.program(input), self.opTable, self.stack)
+
+##########################################################
+# COLUMNS
+##########################################################
+
+"""
+run_columns(input, columns) runs a program once over whole columns of 
+data instead of once per row.  Each column -- a NumPy array, or 
+anything numpy.asarray accepts -- is stored as a variable, so 'a rcl' 
+pushes column 'a' and add, sub, mul, div, int, dup, square, sto and 
+rcl then work on all rows at once.  No instruction depends on the 
+values on the stack, so 'halt' stops every row at the same point; 
+its mask would have all lanes set, and the result is 'halt' as in run.
+Afterwards the names of the columns have their old entries back.
+The program is executed (not interpreted) whatever the verbosity.
+NumPy is only needed here.
+"""
+
+def execute_columns(program, table, columns, S=None):
+  """Store columns (a dict of name: column) as variables in table, run 
+  program once and return its value as an array with one entry per row.
+  The entries of table under those names are put back afterwards."""
+  import numpy
+  rows = None
+  arrays = { }
+  for name in columns:
+    arrays[name] = numpy.asarray(columns[name])
+    if rows is None:
+      rows = len(arrays[name])
+    elif len(arrays[name]) != rows:
+      raise ValueError("columns must have the same length")
+  saved = dict((name, table[name]) for name in arrays if name in table)
+  try:
+    for name in arrays:
+      table[name] = ('var', arrays[name])
+    value = execute(program, table, S)
+  finally:
+    for name in arrays:
+      if name in saved:
+        table[name] = saved[name]
+      else:
+        table.pop(name, None)
+  if type(value) in NUMBERS and rows is not None:
+    value = numpy.full(rows, value)
+  return value
+
+def run_columns(input, columns):
+  """run_columns(input, columns): run the input string once over columns, 
+  a dict of name: column, using the global op table.
+  Example: run_columns('a rcl square b rcl square add', {'a': [3, 5], 'b': [4, 12]})
+
+  Run again and again, once compiled, with the same or new columns:
+  >>> m = StackMachine()
+  >>> columns = {'a': [1, 2], 'b': [10, 20]}
+  >>> [m.run_columns("a rcl 2 mul c sto c rcl b rcl add int", columns).tolist() for k in range(3)]
+  [[12, 24], [12, 24], [12, 24]]
+  >>> [run_columns("2 3 add x rcl mul", {'x': [k, k + 1]}).tolist() for k in range(3)]
+  [[0, 5], [5, 10], [10, 15]]
+
+  The columns are variables only while the program runs:
+  >>> run("7 x sto")
+  >>> run_columns("x rcl 1 add", {'x': [1, 2]}).tolist()
+  [2, 3]
+  >>> run("x rcl")
+  7"""
+  return execute_columns(programCache.program(input), opTable, columns)
+
+# One machine for each thread of a batch worker.
+workerState = None
+
+def run_batch_item(input):
+  """Run input on this thread's machine, reset first so that the 
+  programs of a batch do not see each other's variables.  Return its
+  value, or the exception it raised."""
+  global workerState
+  if workerState is None:
+    import threading
+    workerState = threading.local()
+  machine = getattr(workerState, 'machine', None)
+  if machine is None:
+    machine = workerState.machine = StackMachine()
+  machine.reset()
+  try:
+    return machine.run(input)
+  except Exception as e:
+    return e
+
+def run_batch(inputs, workers=None, threads=False, chunksize=64):
+  """run_batch(inputs, workers=None, threads=False): run each input string 
+  on a fresh op table, in a pool of worker processes (or threads), and 
+  return the results in order.  A program which raises an error has the 
+  exception as its result, so the others' results are not lost.
+  Example: run_batch(['1 2 add', '2 3 mul']) returns [3, 6]."""
+  if threads:
+    from multiprocessing.pool import ThreadPool as pool_class
+  else:
+    from multiprocessing import Pool as pool_class
+  with pool_class(workers) as pool:
+    return pool.map(run_batch_item, inputs, chunksize)
+
+##########################################################
+# SERVER
+##########################################################
+
+"""
+serve(path) keeps a machine warm for a stream of programs, so that each 
+costs microseconds rather than the start of a Python process:
+
+  $ python3 sm.py -S /tmp/sm.sock   -- serve on a Unix socket
+  $ python3 sm.py -S -              -- serve on stdin/stdout
+
+A request is one program per line; the reply is one line of JSON per 
+request, in order: {"value": 3}, or {"error": "KeyError: 'a'"}.  The
+replies are strict JSON: a value of inf or nan, which JSON can't hold,
+is reported as an error.  A client may send many requests before reading the replies.  Each 
+connection has its own machine, reset before every request, so 
+requests don't see each other's variables or definitions; compiled 
+programs stay in the machine's cache.
+"""
+
+def serve_request(machine, line):
+  """Run one request line on machine and return the reply line.
+
+  >>> m = StackMachine()
+  >>> print(serve_request(m, "1 2 add\\n"), end="")
+  {"value": 3}
+  >>> print(serve_request(m, "1.0e999 dup sub\\n"), end="")
+  {"error": "ValueError: nan is not a finite number"}
+  """
+  import json
+  machine.reset()
+  try:
+    reply = {'value': machine.run(line.strip())}
+  except Exception as e:
+    reply = {'error': "%s: %s" % (type(e).__name__, e)}
+  try:
+    return json.dumps(reply, default=repr, allow_nan=False) + "\n"
+  except ValueError:
+    # inf and nan have no JSON
+    reply = {'error': "ValueError: %r is not a finite number" % (reply['value'],)}
+    return json.dumps(reply) + "\n"
+
+async def serve_connection(reader, writer):
+  """Answer the requests of one connection, in order."""
+  machine = StackMachine()
+  while True:
+    line = await reader.readline()
+    if not line:
+      break
+    writer.write(serve_request(machine, line.decode()).encode())
+    await writer.drain()
+  writer.close()
+
+async def serve_socket(path):
+  import asyncio
+  server = await asyncio.start_unix_server(serve_connection, path)
+  async with server:
+    await server.serve_forever()
+
+def serve_stdio(input=sys.stdin, output=sys.stdout):
+  """Answer the requests read from input on output, in order."""
+  machine = StackMachine()
+  for line in input:
+    output.write(serve_request(machine, line))
+    output.flush()
+
+def serve(path=None):
+  """serve(path): answer requests on the Unix socket path, or on 
+  stdin/stdout if path is None or '-'."""
+  if path is None or path == '-':
+    serve_stdio()
+  else:
+    import asyncio
+    asyncio.run(serve_socket(path))
+
 ##########################################################
 # EXAMPLE PROGRAMS AND TESTS
 ##########################################################
@@ -404,6 +1309,13 @@ def verbose_off():
   """verbose_off(): set global verbosity flag to False."""
   set_verbosity(False)
   
+profiling = False
+
+def profiling_on():
+  """profiling_on(): at the command line, profile the code and print the report."""
+  global profiling
+  profiling = True
+
 def _test():
     verbose_off()
     import doctest
@@ -424,14 +1336,20 @@ option_table['-t'] = _test
 option_table['-d'] = print_docstring
 option_table['-v'] = verbose_on
 option_table['-s'] = verbose_off
+option_table['-p'] = profiling_on
 
 def run_option(arg):
-  arg = sys.argv[1]
   if arg in option_table:
     f = option_table[arg]
     f()
 
 def ex_input(input):
+  if profiling:
+    import json
+    result, profiler = profile(" ".join(input))
+    print(result)
+    print(json.dumps(profiler.report(), indent=2))
+    return
   result = ex(input)
   print(result)
 
@@ -439,7 +1357,9 @@ def process_args(arglist):
   if len(arglist) == 0:
     return None
   arg = arglist[0]
-  if arg[0] == "-":
+  if arg == "-S":
+    serve(arglist[1] if len(arglist) > 1 else None)
+  elif arg[0] == "-":
     run_option(arg)
     process_args(arglist[1:])
   else:
@@ -449,10 +1369,7 @@ def process_args(arglist):
 if __name__ == "__main__": 
   verbose_on() # default
 
-  # SELF TEST (runs docstring at head of module):
-  from doctest import testmod
-  import sm
-  testmod(sm)
+  # SELF TEST (runs docstring at head of module): python3 sm.py -t
   
   # PROCESS ARGS:
   if len(sys.argv) == 1:
@@ -14,8 +14,7 @@
 # Site for images: square-the-circle.com
 
 import sys 
-from utilities import saveImage
-from turtle import *
+from utilities import saveImage, new_turtle, draw_segments
 
 def star(turtle, n,r):
   """ draw a star of n rays of length d"""
@@ -43,17 +42,30 @@ def recursive_star(turtle, n, r, depth):
       turtle.penup()
       turtle.backward(r)
       turtle.left(360/n)
+
+def draw_recursive_star(turtle, n, r, depth):
+  """Draw what recursive_star draws, from segments computed all at once
+  by geometry.star_segments and simplified (merged and chained) by 
+  geometry.simplify; without NumPy, by recursive_star itself."""
+  try:
+    from geometry import star_segments, simplify
+    segments = simplify(star_segments(n, r, depth, f))
+  except ImportError:
+    recursive_star(turtle, n, r, depth)
+    return
+  draw_segments(turtle, segments)
+  turtle.penup()
  
-fred = Turtle()
+fred = new_turtle()
 fred.speed("fastest")
 
 # Draw a fractal star of depth sys.argv[2] with sys.argv[1] rays:
-recursive_star(fred, int(sys.argv[1]), 200, int(sys.argv[2]))
+draw_recursive_star(fred, int(sys.argv[1]), 200, int(sys.argv[2]))
 fred.hideturtle()
 
 # If there are enough arguments, save the image:
 if len(sys.argv) == 4:
   saveImage(fred, sys.argv[3]+sys.argv[2]+".eps")
   
-exitonclick()  
+fred.getscreen().exitonclick()  
     
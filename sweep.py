@@ -0,0 +1,179 @@
+# file: sweep.py
+"""
+sweep.py: draw many variants of a figure, over a grid of parameters,
+without a display, in a pool of processes.
+
+Usage:
+
+  % python3 sweep.py nautilus N=108 A=5:30:5 k=0.95,0.97
+  % python3 sweep.py rosetta n=10:30:2 --format svg --out rosettas
+  % python3 sweep.py nautilus A=1:60 k=0.9,0.95,0.97 --workers 8
+  % python3 sweep.py star n=3:8 depth=1:6 --cache ~/.cache/render
+
+The first draws nautilus.repeat(turtle, square, N, A, S, k) for each of
+the 6 combinations of A = 5, 10, ..., 30 and k = 0.95, 0.97 (the other
+parameters keep their defaults, see FIGURES); the second draws rosetta
+figures of n = 10, 12, ..., 30 pentagons; the fourth draws the stars of
+star.py with 3 to 8 rays and depth 1 to 6, taking those drawn before
+from a render cache (see rendercache.py).  Values are given as a list,
+1,2,3, or as a range start:stop:step, stop included (step 1 by default);
+those which count things (INTEGERS: N, n, depth) must be whole numbers.
+
+Each variant is drawn with a RecordingTurtle (recorder.py) and saved in
+the output directory (by default sweep-FIGURE) under a name made of the
+figure and its parameters, e.g. nautilus-A10-N108-S200-k0.97.png, so the
+same variant always goes to the same file.  manifest.json in the same
+directory lists the variants in order, each with its file, parameters,
+number of segments and time to draw and save -- with a cache, whether
+it was taken from it, and the hits and misses of all the workers.
+"""
+import sys, os, time, json, argparse, itertools, inspect
+
+def draw_nautilus(turtle, N=108, A=10, S=200, k=0.97):
+  import nautilus
+  nautilus.repeat(turtle, nautilus.square, N, A, S, k)
+
+def draw_rosetta(turtle, n=20, angle=None):
+  import rosetta
+  rosetta.repeat(rosetta.pentagon, turtle, n, 360/n if angle is None else angle)
+
+def draw_star(turtle, n=4, depth=3, r=200, f=0.3):
+  from geometry import star_segments, simplify
+  turtle.draw_segments(simplify(star_segments(n, r, depth, f)))
+
+# figure name: (function drawing it with a turtle, default parameters);
+# star and cross are those of star.py and cross.py.
+FIGURES = {'nautilus': (draw_nautilus, {'N': 108, 'A': 10, 'S': 200, 'k': 0.97}),
+           'rosetta': (draw_rosetta, {'n': 20}),
+           'star': (draw_star, {'n': 4, 'depth': 3, 'r': 200, 'f': 0.3}),
+           'cross': (draw_star, {'n': 4, 'depth': 4, 'r': 100, 'f': 0.4})}
+
+# the parameters of each figure which count things, and must be integers
+INTEGERS = {'nautilus': ('N',), 'rosetta': ('n',), 'star': ('n', 'depth'), 'cross': ('n', 'depth')}
+
+def parse_values(text):
+  """Return the values of a parameter: '1,2,3' or 'start:stop:step'."""
+  def number(s):
+    return int(s) if s.lstrip('-').isdigit() else float(s)
+  if ':' in text:
+    parts = [number(s) for s in text.split(':')]
+    start, stop = parts[0], parts[1]
+    step = parts[2] if len(parts) > 2 else 1
+    count = int(round((stop - start) / step)) + 1
+    values = [start + k * step for k in range(0, max(0, count))]
+    # 0.9 + 3 * 0.01 is 0.9299999999999999: give the value meant
+    return [round(x, 12) if type(x) == float else x for x in values]
+  return [number(s) for s in text.split(',')]
+
+def integer_values(figure, name, values):
+  """Return values, as ints if name is one of the INTEGERS of figure;
+  raise ValueError if one of those is not a whole number."""
+  if name not in INTEGERS.get(figure, ()):
+    return values
+  for x in values:
+    if x != int(x):
+      raise ValueError("%s of %s must be a whole number, not %r" % (name, figure, x))
+  return [int(x) for x in values]
+
+def parameter_grid(figure, grid):
+  """Return the list of parameter dicts of a sweep: every combination of
+  the values in grid (name: list of values), over the figure's defaults."""
+  function, defaults = FIGURES[figure]
+  names = sorted(grid)
+  jobs = [ ]
+  for values in itertools.product(*(grid[name] for name in names)):
+    params = dict(defaults)
+    params.update(zip(names, values))
+    for name in INTEGERS.get(figure, ()):
+      params[name] = integer_values(figure, name, [params[name]])[0]
+    jobs.append(params)
+  return jobs
+
+def output_name(figure, params, format):
+  """The file name of a variant: the figure, then each parameter, sorted,
+  written out in full (%g would give 1234567 and 1234568 the same name)."""
+  def text(x):
+    return '%d' % x if type(x) == int else repr(x)
+  return '-'.join([figure] + [name + text(params[name]) for name in sorted(params)]) + '.' + format
+
+# one RenderCache for each cache directory, in each process
+renderCaches = { }
+
+def render_cache(directory):
+  from rendercache import RenderCache
+  if directory not in renderCaches:
+    renderCaches[directory] = RenderCache(directory)
+  return renderCaches[directory]
+
+def render_job(job):
+  """Draw one variant and save it: job is (figure, params, path, cache
+  directory or None); return its entry in the manifest."""
+  from recorder import RecordingTurtle
+  figure, params, path, cache = job
+  start = time.perf_counter()
+  if cache is not None:
+    hit = render_cache(cache).fetch(FIGURES[figure][0], params, path.rsplit('.', 1)[-1], path)
+    return {'file': os.path.basename(path), 'params': params, 'cached': hit,
+            'seconds': round(time.perf_counter() - start, 6)}
+  turtle = RecordingTurtle()
+  FIGURES[figure][0](turtle, **params)
+  turtle.save(path)
+  return {'file': os.path.basename(path), 'params': params, 'segments': len(turtle),
+          'seconds': round(time.perf_counter() - start, 6)}
+
+def sweep(figure, grid, directory=None, format='png', workers=None, cache=None):
+  """Draw the variants of figure over grid (see parameter_grid) in workers
+  processes (all cores by default), save them in directory and write
+  its manifest.json; return the manifest.  With cache, a directory, the
+  variants are taken from that render cache or added to it."""
+  directory = directory or 'sweep-' + figure
+  os.makedirs(directory, exist_ok=True)
+  jobs = [(figure, params, os.path.join(directory, output_name(figure, params, format)), cache)
+          for params in parameter_grid(figure, grid)]
+  start = time.perf_counter()
+  if workers == 1:
+    entries = [render_job(job) for job in jobs]
+  else:
+    from multiprocessing import Pool
+    with Pool(workers) as pool:
+      entries = list(pool.imap(render_job, jobs, 4))
+  manifest = {'figure': figure, 'grid': grid, 'format': format, 'jobs': entries,
+              'seconds': round(time.perf_counter() - start, 6)}
+  if cache is not None:
+    # the hits and misses of all the workers' caches
+    hits = sum(1 for entry in entries if entry['cached'])
+    manifest['cache'] = {'hits': hits, 'misses': len(entries) - hits}
+  with open(os.path.join(directory, 'manifest.json'), 'w') as file:
+    json.dump(manifest, file, indent=1)
+  return manifest
+
+def main(argv):
+  parser = argparse.ArgumentParser(description="Draw variants of a figure over a grid of parameters")
+  parser.add_argument("figure", choices=sorted(FIGURES))
+  parser.add_argument("params", nargs="*", metavar="NAME=VALUES", help="e.g. A=5:30:5 or k=0.95,0.97")
+  parser.add_argument("--format", default="png", choices=["png", "svg", "eps"])
+  parser.add_argument("--out", default=None, help="output directory (default sweep-FIGURE)")
+  parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+  parser.add_argument("--cache", default=None, help="render cache directory, see rendercache.py")
+  args = parser.parse_args(argv)
+  function = FIGURES[args.figure][0]
+  names = list(inspect.signature(function).parameters)[1:]
+  grid = { }
+  for param in args.params:
+    name, _, values = param.partition('=')
+    if name not in names:
+      parser.error("%s has parameters %s, not %s" % (args.figure, ', '.join(names), name))
+    try:
+      grid[name] = integer_values(args.figure, name, parse_values(values))
+    except ValueError as e:
+      parser.error(str(e))
+  manifest = sweep(args.figure, grid, args.out, args.format, args.workers, args.cache)
+  jobs = manifest['jobs']
+  print("%d %s files in %.2f s (%.1f per second), manifest in %s" %
+        (len(jobs), args.format, manifest['seconds'], len(jobs) / max(manifest['seconds'], 1e-9),
+         os.path.join(args.out or 'sweep-' + args.figure, 'manifest.json')))
+  if args.cache:
+    print("render cache: %(hits)d hits, %(misses)d misses" % manifest['cache'])
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
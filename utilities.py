@@ -2,8 +2,53 @@
 # Author: J. Carlson
 # Date: Feb 19, 2013
 
+import os, sys
+
+def headless():
+  """True if there is no display to draw on, or TURTLE_HEADLESS is set."""
+  if os.environ.get('TURTLE_HEADLESS'):
+    return True
+  return sys.platform not in ('win32', 'darwin') and not os.environ.get('DISPLAY')
+
+def new_turtle():
+  """Return a Tk Turtle, or a RecordingTurtle (see recorder.py) if 
+  there is no display."""
+  if headless():
+    from recorder import RecordingTurtle
+    return RecordingTurtle()
+  from turtle import Turtle
+  return Turtle()
+
+def draw_segments(turtle, segments):
+  """Draw segments, rows x0 y0 x1 y1 (see geometry.py), with any turtle:
+  a RecordingTurtle takes them in one call, a Tk Turtle draws them with
+  animation off.  The turtle's position and pen are left as they were."""
+  if hasattr(turtle, 'draw_segments'):
+    turtle.draw_segments(segments)
+    return
+  screen = turtle.getscreen()
+  tracer = screen.tracer()
+  screen.tracer(0)
+  position = turtle.position()
+  down = turtle.isdown()
+  for x0, y0, x1, y1 in segments:
+    turtle.penup()
+    turtle.goto(x0, y0)
+    turtle.pendown()
+    turtle.goto(x1, y1)
+  turtle.penup()
+  turtle.goto(position)
+  if down:
+    turtle.pendown()
+  screen.update()
+  screen.tracer(tracer)
+
 def saveImage(turtle, filename):
-  """Save turtle graphics drawing to eps file."""
+  """Save turtle graphics drawing to eps file.  A RecordingTurtle 
+  can also save to .svg and .png files."""
+  if hasattr(turtle, 'save'):
+    turtle.save(filename)
+    return
   ts = turtle.getscreen()
   tc = ts.getcanvas()
   tc.postscript(file=filename)
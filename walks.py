@@ -0,0 +1,435 @@
+# file: walks.py
+"""
+walks.py: random walks simulated with NumPy, many at a time.
+
+Usage:
+
+  % python3 walks.py 100000 2000              -- 100000 walks as in rw.py
+  % python3 walks.py 100000 2000 --grid       -- walks as in rwgrid.py
+  % python3 walks.py 100000 2000 --seed 1     -- the same walks every time
+  % python3 walks.py 10000000 100 --workers 8 -- in 8 processes, see run_trials
+  % python3 walks.py 1000 100000 --save w.traj -- keep the walks, see TRAJECTORIES
+
+prints the distribution of the end-to-end distance of the walks; the
+fourth prints summary statistics kept on the fly, see TRIALS below.
+
+The walks are those of rw.py and rwgrid.py.  A continuous walk starts
+at (0, 0) heading east; at each step it turns through an angle uniform
+in -90..90 degrees and goes forward a distance uniform in 0..distance.
+A grid walk turns 90 degrees left or right and goes forward distance.
+Instead of moving a turtle step by step, walk_positions draws all the
+turns and lengths of a batch of walks as arrays, and cumulative sums
+give the headings and then the positions, as complex numbers:
+
+  >>> p = walk_positions(3, 1000, 10, grid=True, seed=1)
+  >>> p.shape
+  (3, 1001)
+  >>> float(abs(p[:, 1:] - p[:, :-1]).max())
+  10.0
+
+The walks depend only on the seed (an int, or a numpy Generator):
+walk_positions(..., seed=1) is the same every time.  end_distances
+runs any number of walks in batches, keeping only the distances, and
+distance_report prints their distribution next to the expected root
+mean square distance.  Nothing here draws: rw.py and rwgrid.py draw
+paths with walk_segments and utilities.draw_segments.
+"""
+import sys, math, argparse
+
+# Walks per batch in end_distances are chosen so that a batch has about
+# this many steps (16 bytes each, for positions).
+BATCH_STEPS = 1 << 22
+
+# Unit moves for the headings east, north, west, south of a grid walk.
+GRID_MOVES = (1, 1j, -1, -1j)
+
+def generator(seed=None):
+  """Return a numpy random Generator for seed (an int, None for a fresh
+  seed, or a Generator, returned as it is)."""
+  import numpy
+  if isinstance(seed, numpy.random.Generator):
+    return seed
+  return numpy.random.default_rng(seed)
+
+def grid_turns(rng, walks, steps):
+  """Return the turns of walks grid walks, +1 for left and -1 for right,
+  as an int8 array of shape (walks, steps)."""
+  import numpy
+  turns = rng.integers(0, 2, (walks, steps), dtype=numpy.int8) * 2 - 1
+  return turns.astype(numpy.int8)
+
+def grid_moves(turns, distance):
+  """Return the moves of grid walks with the given turns (an array whose
+  last axis is the steps), as complex numbers."""
+  import numpy
+  headings = numpy.cumsum(turns, axis=-1, dtype=numpy.int64) % 4
+  return distance * numpy.array(GRID_MOVES)[headings]
+
+def walk_moves(rng, walks, steps, distance, grid):
+  """Return the moves of walks random walks of steps steps, as a complex
+  array of shape (walks, steps)."""
+  import numpy
+  if grid:
+    return grid_moves(grid_turns(rng, walks, steps), distance)
+  angles = rng.uniform(-math.pi/2, math.pi/2, (walks, steps))
+  lengths = rng.uniform(0, distance, (walks, steps))
+  return lengths * numpy.exp(1j * numpy.cumsum(angles, axis=1))
+
+def walk_positions(walks, steps, distance=5, grid=False, seed=None):
+  """Return the positions of walks random walks from (0, 0), as a complex
+  array of shape (walks, steps + 1); see above."""
+  import numpy
+  moves = walk_moves(generator(seed), walks, steps, distance, grid)
+  positions = numpy.zeros((walks, steps + 1), dtype=complex)
+  numpy.cumsum(moves, axis=1, out=positions[:, 1:])
+  return positions
+
+def walk_segments(positions):
+  """Return the segments of a walk, rows x0 y0 x1 y1, for
+  utilities.draw_segments."""
+  import numpy
+  return numpy.column_stack((positions.real[:-1], positions.imag[:-1],
+                             positions.real[1:], positions.imag[1:]))
+
+def end_distances(walks, steps, distance=5, grid=False, seed=None, batch=None):
+  """Return the end-to-end distances of walks random walks, as an array.
+  The walks are run batch at a time (by default BATCH_STEPS // steps), so
+  memory use does not depend on walks."""
+  import numpy
+  rng = generator(seed)
+  if batch is None:
+    batch = max(1, BATCH_STEPS // max(1, steps))
+  distances = numpy.empty(walks)
+  for start in range(0, walks, batch):
+    m = min(batch, walks - start)
+    ends = walk_moves(rng, m, steps, distance, grid).sum(axis=1)
+    distances[start:start+m] = numpy.abs(ends)
+  return distances
+
+def expected_rms(steps, distance=5, grid=False):
+  """The expected root mean square end-to-end distance.  The steps of
+  a grid walk are uncorrelated: distance * sqrt(steps).  For a
+  continuous walk, steps k apart have correlation c**k, c = 2/pi, their
+  lengths mean distance/2 and mean square distance**2/3."""
+  if grid:
+    return distance * math.sqrt(steps)
+  c = 2 / math.pi
+  pairs = sum((steps - k) * c**k for k in range(1, steps))
+  return math.sqrt(steps * distance**2 / 3 + 2 * (distance / 2)**2 * pairs)
+
+def distance_report(distances, steps, distance=5, grid=False, bins=10, width=50):
+  """Print the distribution of distances: summary statistics and a
+  histogram of bins bars at most width characters long."""
+  import numpy
+  rms = math.sqrt(numpy.mean(distances**2))
+  print("walks: %d, steps: %d, %s, step %g" %
+        (len(distances), steps, "grid" if grid else "continuous", distance))
+  print("  %-14s %10.3f" % ("mean", numpy.mean(distances)))
+  print("  %-14s %10.3f   (expected %.3f)" % ("rms", rms, expected_rms(steps, distance, grid)))
+  for q in (10, 50, 90, 99):
+    print("  %-14s %10.3f" % ("%d%%" % q, numpy.percentile(distances, q)))
+  print("  %-14s %10.3f" % ("max", numpy.max(distances)))
+  counts, edges = numpy.histogram(distances, bins)
+  top = max(1, counts.max())
+  for k in range(0, len(counts)):
+    bar = '#' * int(round(width * counts[k] / top))
+    print("  %8.1f - %8.1f %9d %s" % (edges[k], edges[k+1], counts[k], bar))
+
+##########################################################
+# TRIALS
+##########################################################
+
+"""
+run_trials runs any number of walks in a pool of processes and keeps
+only statistics: for each walk its final displacement and its maximum
+excursion (distance from the start) go into an Accumulator, and the
+squared distance at each step into a running sum, for the mean square
+displacement over time.  Memory use depends on steps, not on trials.
+
+The walks are cut into tasks of TRIALS_PER_TASK walks, and each task
+gets its own random stream, spawned from numpy.random.SeedSequence(seed).
+Tasks are merged in order, so the result for a seed is the same for
+any number of workers.
+"""
+
+TRIALS_PER_TASK = 100000
+
+class Accumulator:
+  """Count, mean, variance, min and max of a stream of values, added a
+  batch at a time; two accumulators merge (Chan et al.)."""
+
+  def __init__(self):
+    self.count = 0
+    self.mean = 0.0
+    self.m2 = 0.0          # sum of squared differences from the mean
+    self.min = math.inf
+    self.max = -math.inf
+
+  def add(self, values):
+    """Add an array of values."""
+    if len(values) == 0:
+      return
+    batch = Accumulator()
+    batch.count = len(values)
+    batch.mean = float(values.mean())
+    batch.m2 = float(((values - batch.mean)**2).sum())
+    batch.min = float(values.min())
+    batch.max = float(values.max())
+    self.merge(batch)
+
+  def merge(self, other):
+    """Add the values of another accumulator."""
+    n = self.count + other.count
+    if n == 0:
+      return
+    delta = other.mean - self.mean
+    self.mean = self.mean + delta * other.count / n
+    self.m2 = self.m2 + other.m2 + delta**2 * self.count * other.count / n
+    self.count = n
+    self.min = min(self.min, other.min)
+    self.max = max(self.max, other.max)
+
+  def variance(self):
+    return self.m2 / self.count if self.count > 0 else 0.0
+
+  def std(self):
+    return math.sqrt(self.variance())
+
+class WalkStats:
+  """Statistics of trials walks of steps steps: Accumulators final and
+  excursion, and square_sums[t], the sum over the walks of the squared
+  distance after t steps."""
+
+  def __init__(self, steps):
+    import numpy
+    self.steps = steps
+    self.final = Accumulator()
+    self.excursion = Accumulator()
+    self.square_sums = numpy.zeros(steps + 1)
+
+  def add(self, positions):
+    """Add walks, given by their positions as from walk_positions."""
+    import numpy
+    squares = positions.real**2 + positions.imag**2
+    self.final.add(numpy.sqrt(squares[:, -1]))
+    self.excursion.add(numpy.sqrt(squares.max(axis=1)))
+    self.square_sums += squares.sum(axis=0)
+
+  def merge(self, other):
+    self.final.merge(other.final)
+    self.excursion.merge(other.excursion)
+    self.square_sums += other.square_sums
+
+  def msd(self):
+    """The mean square displacement after 0, 1, ... steps, an array."""
+    return self.square_sums / max(1, self.final.count)
+
+def run_task(task):
+  """Run one task of run_trials: (seed sequence, trials, steps, distance,
+  grid); return its WalkStats."""
+  seed, trials, steps, distance, grid = task
+  rng = generator(seed)
+  stats = WalkStats(steps)
+  batch = max(1, BATCH_STEPS // max(1, steps))
+  for start in range(0, trials, batch):
+    stats.add(walk_positions(min(batch, trials - start), steps, distance, grid, rng))
+  return stats
+
+def run_trials(trials, steps, distance=5, grid=False, seed=None, workers=None):
+  """Run trials random walks in workers processes (all cores by default)
+  and return their WalkStats; see above."""
+  import numpy
+  root = numpy.random.SeedSequence(seed)
+  sizes = [min(TRIALS_PER_TASK, trials - k) for k in range(0, trials, TRIALS_PER_TASK)]
+  tasks = [(s, size, steps, distance, grid) for (s, size) in zip(root.spawn(len(sizes)), sizes)]
+  stats = WalkStats(steps)
+  if workers == 1 or len(tasks) <= 1:
+    for task in tasks:
+      stats.merge(run_task(task))
+    return stats
+  from multiprocessing import Pool
+  with Pool(workers) as pool:
+    for result in pool.imap(run_task, tasks):
+      stats.merge(result)
+  return stats
+
+def trials_report(stats, distance=5, grid=False, rows=10):
+  """Print the statistics of run_trials, with the mean square
+  displacement at rows times."""
+  steps = stats.steps
+  print("walks: %d, steps: %d, %s, step %g" %
+        (stats.final.count, steps, "grid" if grid else "continuous", distance))
+  print("  %-14s %10s %10s %10s %10s" % ("", "mean", "std", "min", "max"))
+  for name, a in (("final", stats.final), ("max excursion", stats.excursion)):
+    print("  %-14s %10.3f %10.3f %10.3f %10.3f" % (name, a.mean, a.std(), a.min, a.max))
+  msd = stats.msd()
+  print("  %-14s %12s %12s" % ("step", "msd", "expected"))
+  for t in sorted(set(steps * k // rows for k in range(1, rows + 1))):
+    print("  %-14d %12.1f %12.1f" % (t, msd[t], expected_rms(t, distance, grid)**2))
+
+##########################################################
+# TRAJECTORIES
+##########################################################
+
+"""
+A trajectory file keeps whole walks, all of the same number of steps,
+written a batch at a time and read back through a memory map, so that
+a file of billions of steps can be sliced without loading it:
+
+  with TrajectoryWriter("walks.traj", steps, distance, grid) as out:
+    out.add(...)                     -- positions, or turns for grid walks
+  walks = TrajectoryReader("walks.traj")
+  walks.positions(7, 1000, 2000)     -- steps 1000..1999 of walk 7
+
+save_walks does both for simulated walks ('walks.py ... --save FILE').
+
+The file is a header of HEADER_SIZE bytes (see HEADER) and then the
+walks one after the other, steps records each.  The positions of a
+continuous walk after each step are stored as x, y pairs of float32
+(8 bytes a step) or float64; the start (0, 0) is not stored.  A grid
+walk is stored as its turns, one int8 (+1 or -1) a step: the headings
+and positions are recomputed with cumulative sums when read.  The
+number of walks is not in the header but follows from the size of the
+file, so a file cut short by a crash is read up to its last whole walk.
+"""
+
+# magic, dtype of the records ('<f4', '<f8' or '|i1'), steps, step length
+HEADER = '<4s4sQd'
+HEADER_SIZE = 64
+TRAJECTORY_MAGIC = b'WALK'
+
+class TrajectoryWriter:
+  """Write walks to a trajectory file, see above.  dtype is that of the
+  coordinates of continuous walks; grid walks are stored as int8 turns."""
+
+  def __init__(self, path, steps, distance=5, grid=False, dtype='<f4'):
+    import struct, numpy
+    self.steps = steps
+    self.grid = grid
+    self.dtype = numpy.dtype('|i1' if grid else dtype)
+    self.file = open(path, 'wb')
+    header = struct.pack(HEADER, TRAJECTORY_MAGIC, self.dtype.str.encode(), steps, distance)
+    self.file.write(header.ljust(HEADER_SIZE, b'\0'))
+    self.walks = 0
+
+  def add(self, walks):
+    """Append walks: for continuous walks their positions, a complex array
+    of shape (walks, steps + 1) as from walk_positions; for grid walks
+    their turns, of shape (walks, steps) as from grid_turns."""
+    import numpy
+    if self.grid:
+      records = numpy.asarray(walks, dtype=self.dtype)
+    else:
+      records = numpy.stack((walks.real[:, 1:], walks.imag[:, 1:]), axis=-1).astype(self.dtype)
+    if records.shape[1] != self.steps:
+      raise ValueError("trajectory: walks of %d steps, expected %d" % (records.shape[1], self.steps))
+    records.tofile(self.file)
+    self.walks = self.walks + len(records)
+
+  def close(self):
+    self.file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+class TrajectoryReader:
+  """Read a trajectory file through a memory map, see above."""
+
+  def __init__(self, path):
+    import os, struct, numpy
+    with open(path, 'rb') as file:
+      header = file.read(HEADER_SIZE)
+    magic, dtype, self.steps, self.distance = struct.unpack_from(HEADER, header)
+    if magic != TRAJECTORY_MAGIC:
+      raise ValueError("%s: not a trajectory file" % path)
+    self.dtype = numpy.dtype(dtype.rstrip(b'\0').decode())
+    self.grid = self.dtype.kind == 'i'
+    shape = (self.steps,) if self.grid else (self.steps, 2)
+    walk_size = self.dtype.itemsize * max(1, self.steps) * (1 if self.grid else 2)
+    walks = (os.path.getsize(path) - HEADER_SIZE) // walk_size
+    if walks == 0:
+      self.data = numpy.empty((0,) + shape, dtype=self.dtype)
+    else:
+      self.data = numpy.memmap(path, self.dtype, 'r', HEADER_SIZE, (walks,) + shape)
+
+  def __len__(self):
+    """The number of walks."""
+    return len(self.data)
+
+  def positions(self, walk, start=0, stop=None):
+    """Return positions start .. stop - 1 (0 .. steps) of a walk, as a
+    complex array.  For a grid walk the turns up to stop are read."""
+    import numpy
+    if stop is None or stop > self.steps + 1:
+      stop = self.steps + 1
+    start = min(start, stop)
+    if self.grid:
+      moves = grid_moves(self.data[walk, :max(0, stop - 1)], self.distance)
+      return numpy.concatenate(([0j], numpy.cumsum(moves)))[start:stop]
+    rows = self.data[walk, max(0, start - 1):max(0, stop - 1)]
+    points = rows[:, 0] + 1j * rows[:, 1].astype(float)
+    if start == 0 and stop > 0:
+      points = numpy.concatenate(([0j], points))
+    return points
+
+  def segments(self, walk, start=0, stop=None):
+    """The segments of positions start .. stop - 1 of a walk, to draw."""
+    return walk_segments(self.positions(walk, start, stop))
+
+  def end_distances(self):
+    """The end-to-end distances of the walks, read a batch at a time."""
+    import numpy
+    distances = numpy.empty(len(self))
+    batch = max(1, BATCH_STEPS // max(1, self.steps))
+    for start in range(0, len(self), batch):
+      block = self.data[start:start+batch]
+      if self.grid:
+        ends = grid_moves(block, self.distance).sum(axis=1)
+      else:
+        ends = block[:, -1, 0] + 1j * block[:, -1, 1].astype(float)
+      distances[start:start+batch] = numpy.abs(ends)
+    return distances
+
+def save_walks(path, walks, steps, distance=5, grid=False, seed=None, dtype='<f4'):
+  """Simulate walks random walks and write them to a trajectory file, a
+  batch at a time."""
+  rng = generator(seed)
+  batch = max(1, BATCH_STEPS // max(1, steps))
+  with TrajectoryWriter(path, steps, distance, grid, dtype) as out:
+    for start in range(0, walks, batch):
+      m = min(batch, walks - start)
+      if grid:
+        out.add(grid_turns(rng, m, steps))
+      else:
+        out.add(walk_positions(m, steps, distance, False, rng))
+
+def main(argv):
+  parser = argparse.ArgumentParser(description="Distribution of the end-to-end distance of random walks")
+  parser.add_argument("walks", type=int)
+  parser.add_argument("steps", type=int)
+  parser.add_argument("--distance", type=float, default=5, help="step length (default 5)")
+  parser.add_argument("--grid", action="store_true", help="walk on a square grid, as rwgrid.py")
+  parser.add_argument("--seed", type=int, default=None, help="seed, for reproducible walks")
+  parser.add_argument("--bins", type=int, default=10, help="bars in the histogram")
+  parser.add_argument("--workers", type=int, default=None,
+                      help="run the walks in this many processes, keeping only statistics (0: all cores)")
+  parser.add_argument("--save", metavar="FILE", default=None,
+                      help="write the walks to a trajectory file, see TRAJECTORIES")
+  args = parser.parse_args(argv)
+  if args.save:
+    save_walks(args.save, args.walks, args.steps, args.distance, args.grid, args.seed)
+    distances = TrajectoryReader(args.save).end_distances()
+    distance_report(distances, args.steps, args.distance, args.grid, args.bins)
+    return
+  if args.workers is not None:
+    stats = run_trials(args.walks, args.steps, args.distance, args.grid, args.seed, args.workers or None)
+    trials_report(stats, args.distance, args.grid)
+    return
+  distances = end_distances(args.walks, args.steps, args.distance, args.grid, args.seed)
+  distance_report(distances, args.steps, args.distance, args.grid, args.bins)
+
+if __name__ == "__main__":
+  main(sys.argv[1:])